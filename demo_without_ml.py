@@ -5,13 +5,16 @@ Demo script that shows the PDF processing pipeline without ML models.
 This helps test the core functionality before installing heavy dependencies.
 """
 
-import os
+import re
 import sys
 from pathlib import Path
 
 # Add src to path for imports
 sys.path.insert(0, 'src')
 
+# Sentence boundary: whitespace following terminal punctuation
+SENTENCE_SPLIT_RE = re.compile(r'(?<=[.!?])\s+')
+
 def demo_pdf_extraction():
     """Demo the PDF extraction capabilities"""
     print("🔍 PDF Extraction Demo")
@@ -51,29 +54,34 @@ def demo_pdf_extraction():
         print("⚠️ Tiktoken not installed - using character-based chunking simulation")
 
         # Simulate chunks by splitting on sentences
-        sentences = sample_text.split('.')
+        sentences = SENTENCE_SPLIT_RE.split(sample_text.strip())
         chunks = []
-        current_chunk = ""
+        current_parts = []
+        current_len = 0
         chunk_id = 0
 
         for sentence in sentences:
-            if len(current_chunk + sentence) < 200:  # Simulate token limit
-                current_chunk += sentence + "."
+            if current_len + len(sentence) < 200:  # Simulate token limit
+                current_parts.append(sentence)
+                current_len += len(sentence) + 1
             else:
-                if current_chunk:
+                if current_parts:
+                    current_chunk = ' '.join(current_parts)
                     chunks.append(TextChunk(
-                        content=current_chunk.strip(),
+                        content=current_chunk,
                         chunk_id=chunk_id,
                         source_pages=[1],
                         chapter_title="Chapter 1: Clean Code",
                         token_count=len(current_chunk.split())
                     ))
                     chunk_id += 1
-                current_chunk = sentence + "."
+                current_parts = [sentence]
+                current_len = len(sentence) + 1
 
-        if current_chunk:
+        if current_parts:
+            current_chunk = ' '.join(current_parts)
             chunks.append(TextChunk(
-                content=current_chunk.strip(),
+                content=current_chunk,
                 chunk_id=chunk_id,
                 source_pages=[1],
                 chapter_title="Chapter 1: Clean Code",
@@ -90,25 +98,23 @@ def demo_pdf_extraction():
 
         # Create mock notes
         from note_generator import GeneratedNote
-        mock_notes = []
-        for chunk in chunks:
-            # Create a simple mock note
-            mock_content = f"Key points from this section:\n• {chunk.content[:100]}...\n• Important concepts mentioned\n• Technical details to remember"
-            mock_notes.append(GeneratedNote(
-                content=mock_content,
+        mock_notes = [
+            GeneratedNote(
+                # Create a simple mock note
+                content=f"Key points from this section:\n• {chunk.content[:100]}...\n• Important concepts mentioned\n• Technical details to remember",
                 source_chunk_ids=[chunk.chunk_id],
                 source_pages=chunk.source_pages,
                 chapter_title=chunk.chapter_title
-            ))
+            )
+            for chunk in chunks
+        ]
 
         # Generate markdown
         markdown_content = formatter.format_notes_to_markdown(mock_notes, "clean_code_demo.pdf")
 
-        # Save demo output
-        os.makedirs("demo_output", exist_ok=True)
+        # Save demo output (MarkdownFormatter already created the directory)
         demo_file = "demo_output/demo_notes.md"
-        with open(demo_file, 'w', encoding='utf-8') as f:
-            f.write(markdown_content)
+        Path(demo_file).write_text(markdown_content, encoding='utf-8')
 
         print(f"✅ Demo markdown saved to: {demo_file}")
         print(f"📊 Generated {len(mock_notes)} mock notes")
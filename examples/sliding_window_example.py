@@ -52,10 +52,17 @@ def process_pdf_with_sliding_window(
 
     # Step 1: Extract text from PDF
     print(f"📄 Extracting text from {pdf_path}...")
-    extractor = PDFExtractor(pdf_path)
-    extracted_sections = extractor.extract_text()
-    text = ' '.join([section.content for section in extracted_sections])
-    page_count = len(set(section.page_number for section in extracted_sections))
+    page_numbers = set()
+
+    def section_texts(extractor):
+        # Stream sections straight into the join instead of keeping them all
+        for section in extractor.iter_sections():
+            page_numbers.add(section.page_number)
+            yield section.content
+
+    with PDFExtractor(pdf_path) as extractor:
+        text = ' '.join(section_texts(extractor))
+    page_count = len(page_numbers)
     print(f"✅ Extracted {page_count} pages")
 
     # Step 2: Create overlapping chunks (SMALLER CHUNKS = BETTER RESULTS)
@@ -73,12 +80,11 @@ def process_pdf_with_sliding_window(
     # Step 3: Generate notes for each chunk
     print(f"\n📝 Generating notes for {len(chunks)} chunks...")
     generator = APIBasedNoteGenerator()
-    notes = []
+    notes = [None] * len(chunks)
 
-    for i, chunk in enumerate(chunks, 1):
-        print(f"  Chunk {i}/{len(chunks)}: {chunk.token_count} tokens", end="")
-        note = generator.generate_note_from_chunk(chunk)
-        notes.append(note)
+    for i, chunk in enumerate(chunks):
+        print(f"  Chunk {i + 1}/{len(chunks)}: {chunk.token_count} tokens", end="")
+        notes[i] = generator.generate_note_from_chunk(chunk)
         print(" ✓")
 
     print(f"✅ Generated {len(notes)} individual notes")
@@ -114,8 +120,7 @@ def process_pdf_with_sliding_window(
     output_path = Path(output_dir) / f"{Path(pdf_path).stem}_sliding_window.md"
     output_path.parent.mkdir(parents=True, exist_ok=True)
 
-    with open(output_path, 'w') as f:
-        f.write(markdown)
+    output_path.write_text(markdown, encoding='utf-8')
 
     print(f"✅ Saved to {output_path}")
     return str(output_path)
@@ -6,19 +6,23 @@ models:
 """
 #!/usr/bin/env python3
 
+import asyncio
 import click
-import os
+import queue
 import sys
+import threading
+from dataclasses import replace
 from pathlib import Path
 from tqdm import tqdm
 
-from src.pdf_extractor import PDFExtractor
+from src.pdf_extractor import PDFExtractor, ExtractedText
 from src.text_chunker import TextChunker
-from src.note_generator import NoteGenerator
-from src.api_note_generator import APIBasedNoteGenerator
-from src.markdown_formatter import MarkdownFormatter
 from src.gpu_optimizer import GPUOptimizer
-from src.bookmark_chunker import BookmarkChunker
+from src.cli_utils import parse_page_bounds
+
+# Note generators, the formatter (which pulls in note_generator) and the
+# bookmark chunker are imported inside main() only on the paths that use them,
+# keeping --help and --show-gpu-info fast
 
 
 @click.command()
@@ -37,6 +41,8 @@ from src.bookmark_chunker import BookmarkChunker
               help='Device to use: auto, cpu, cuda, or mps')
 @click.option('--pages', '-p', default=None,
               help='Page range to process (e.g., "1-10" or "5,7,9-12")')
+@click.option('--extract-workers', default=None, type=int,
+              help='Worker processes for page-range extraction (default: one per CPU)')
 @click.option('--auto-optimize', is_flag=True, default=True,
               help='Automatically optimize settings based on GPU (default: True)')
 @click.option('--show-gpu-info', is_flag=True,
@@ -45,9 +51,19 @@ from src.bookmark_chunker import BookmarkChunker
               help='Use Claude API instead of local models (requires CLAUDE_KEY in .env)')
 @click.option('--api-model', default="claude-3-5-sonnet-20241022",
               help='Claude API model to use (sonnet or haiku)')
+@click.option('--no-model-routing', is_flag=True,
+              help='Send every chunk to --api-model instead of routing short chunks to Haiku')
+@click.option('--structured-output', is_flag=True,
+              help='Have Claude return notes as structured sections via tool calling')
+@click.option('--api-concurrency', default=10,
+              help='Maximum number of concurrent Claude API requests')
+@click.option('--cache-dir', default=".notecache",
+              help='Directory for the persistent note cache')
+@click.option('--no-cache', is_flag=True,
+              help='Regenerate every note instead of reusing cached notes')
 @click.option('--auto', is_flag=True,
               help='Auto-detect book structure from PDF bookmarks (recommended)')
-def main(pdf_path, model, chunk_size, overlap, output_dir, obsidian, device, pages, auto_optimize, show_gpu_info, use_api, api_model, auto):
+def main(pdf_path, model, chunk_size, overlap, output_dir, obsidian, device, pages, extract_workers, auto_optimize, show_gpu_info, use_api, api_model, no_model_routing, structured_output, api_concurrency, cache_dir, no_cache, auto):
     """
     Extract and generate structured notes from PDF documents.
 
@@ -97,10 +113,6 @@ def main(pdf_path, model, chunk_size, overlap, output_dir, obsidian, device, pag
 
     click.echo(f"📏 Chunk size: {chunk_size} tokens")
 
-    if not os.path.exists(pdf_path):
-        click.echo(f"❌ Error: PDF file not found: {pdf_path}", err=True)
-        sys.exit(1)
-
     try:
         # Initialize components
         click.echo("🔧 Initializing components...")
@@ -108,9 +120,7 @@ def main(pdf_path, model, chunk_size, overlap, output_dir, obsidian, device, pag
         # Parse page range if specified
         start_page, end_page = None, None
         if pages:
-            page_list = parse_pages(pages)
-            start_page = page_list[0]  # 1-based
-            end_page = page_list[-1]   # 1-based
+            start_page, end_page = parse_page_bounds(pages)  # 1-based
             click.echo(f"📄 Page range: {start_page}-{end_page}")
 
         # Try auto mode (bookmark-based chunking) if --auto flag is set
@@ -120,7 +130,9 @@ def main(pdf_path, model, chunk_size, overlap, output_dir, obsidian, device, pag
         if auto:
             click.echo("🔍 Checking for PDF bookmarks...")
             try:
-                with BookmarkChunker(pdf_path, chunk_size, overlap) as chunker:
+                from src.bookmark_chunker import BookmarkChunker
+
+                with BookmarkChunker(pdf_path, chunk_size, overlap, extract_workers) as chunker:
                     if chunker.has_bookmarks():
                         click.echo("✅ Bookmarks found! Using structure-aware chunking...")
                         use_bookmark_chunking = True
@@ -141,92 +153,86 @@ def main(pdf_path, model, chunk_size, overlap, output_dir, obsidian, device, pag
 
         # Fallback to traditional token-based chunking if auto mode failed or not requested
         if not use_bookmark_chunking:
-            with PDFExtractor(pdf_path) as extractor:
-                # Extract text from PDF
-                click.echo("📖 Extracting text from PDF...")
-                if pages:
-                    # Extract specified page range as one continuous block
-                    text = extractor.get_text_by_pages(start_page - 1, end_page)
-                    if text.strip():
-                        from src.pdf_extractor import ExtractedText
-                        extracted_sections = [ExtractedText(
-                            content=text,
-                            page_number=start_page,
-                            chapter_title=""
-                        )]
-                    else:
-                        extracted_sections = []
-                else:
-                    extracted_sections = extractor.extract_text()
-
-                if not extracted_sections:
-                    click.echo("❌ No text extracted from PDF", err=True)
-                    sys.exit(1)
-
-                click.echo(f"📄 Extracted {len(extracted_sections)} sections")
-
-            # Initialize chunker and chunk text
-            click.echo("✂️ Chunking text...")
-            chunker = TextChunker(max_chunk_size=chunk_size, overlap_size=overlap)
-
-            for section in extracted_sections:
-                chunks = chunker.smart_chunk(
-                    section.content,
-                    [section.page_number],
-                    section.chapter_title
-                )
-                all_chunks.extend(chunks)
-
-            click.echo(f"📝 Created {len(all_chunks)} text chunks")
+            # Extract and chunk in a background thread so generation can start
+            # on the first chunks while the rest of the PDF is still being read
+            click.echo("📖 Extracting and chunking text from PDF...")
+            chunk_source = iter_in_background(iter_text_chunks(
+                pdf_path,
+                start_page,
+                end_page,
+                chunk_size,
+                overlap,
+                extract_workers
+            ))
+        else:
+            chunk_source = all_chunks
 
         # Initialize note generator
         click.echo("🧠 Loading language model...")
         if use_api:
-            note_generator = APIBasedNoteGenerator(model_name=api_model)
+            from src.api_note_generator import APIBasedNoteGenerator
+            note_generator = APIBasedNoteGenerator(
+                model_name=api_model,
+                enable_model_routing=not no_model_routing,
+                structured_output=structured_output
+            )
         else:
+            from src.note_generator import NoteGenerator
             note_generator = NoteGenerator(model_name=model, device=device)
 
+        if not no_cache:
+            # Reuse notes for chunks already generated with this model and prompt
+            from src.note_cache import NoteCache, CachedNoteGenerator
+            note_generator = CachedNoteGenerator(note_generator, NoteCache(cache_dir))
+
         # Generate notes
         click.echo("✍️ Generating notes...")
 
-        # Generate notes differently based on chunking mode
+        total = len(all_chunks) if use_bookmark_chunking else None
+        # Redraw at most ~100 times however many chunks there are
+        with tqdm(total=total, desc="Processing chunks", mininterval=0.5,
+                  miniters=max(1, (total or 0) // 100), smoothing=0.1) as pbar:
+            # Keep several requests in flight: API calls are network-bound, and
+            # the local model decodes as many requests at once as this GPU allows
+            concurrency = api_concurrency if use_api else max(1, optimized['batch_size'])
+            notes = asyncio.run(generate_notes_concurrently(
+                note_generator,
+                chunk_source,
+                concurrency,
+                pbar
+            ))
+
+        if not notes:
+            click.echo("❌ No text extracted from PDF", err=True)
+            sys.exit(1)
+
+        from src.markdown_formatter import MarkdownFormatter
+
+        # Format notes differently based on chunking mode
         if use_bookmark_chunking:
             # For structured chunks, pair them with generated notes
-            structured_notes = []
-
-            with tqdm(total=len(all_chunks), desc="Processing chunks") as pbar:
-                for chunk in all_chunks:
-                    # Generate note for this structured chunk
-                    note = note_generator.generate_note_from_chunk(chunk)
-                    structured_notes.append((chunk, note))
-                    pbar.update(1)
+            structured_notes = list(zip(all_chunks, notes))
 
             # Format structured notes with hierarchy
             click.echo("📋 Formatting structured notes...")
             formatter = MarkdownFormatter(output_dir)
-            markdown_content = formatter.format_structured_notes_to_markdown(
+            # Kept as lines; save_markdown_file writes them without joining
+            markdown_content = formatter.format_structured_notes_to_markdown_lines(
                 structured_notes,
                 pdf_path,
                 model_name=note_generator.model_name
             )
 
         else:
-            # Traditional note generation and formatting
-            with tqdm(total=len(all_chunks), desc="Processing chunks") as pbar:
-                notes = []
-                for chunk in all_chunks:
-                    note = note_generator.generate_note_from_chunk(chunk)
-                    notes.append(note)
-                    pbar.update(1)
-
-            # Format and save notes
+            # Traditional formatting
             click.echo("📋 Formatting notes...")
             formatter = MarkdownFormatter(output_dir)
 
             if obsidian:
-                markdown_content = formatter.create_obsidian_compatible_note(notes, pdf_path)
+                # Both outputs come from the same scan of the notes
+                summary_content, markdown_content = formatter.build_summary_and_obsidian(notes, pdf_path)
             else:
-                markdown_content = formatter.format_notes_to_markdown(
+                markdown_content = formatter.format_notes_to_markdown_lines(
                     notes,
                     pdf_path,
                     model_name=note_generator.model_name
@@ -236,14 +242,14 @@ def main(pdf_path, model, chunk_size, overlap, output_dir, obsidian, device, pag
 
         # Generate summary (only for traditional mode)
         if not use_bookmark_chunking:
-            summary_content = formatter.create_summary_section(notes, pdf_path)
+            if not obsidian:
+                summary_content = formatter.create_summary_section(notes, pdf_path)
             summary_path = output_path.replace('.md', '_summary.md')
-            with open(summary_path, 'w', encoding='utf-8') as f:
-                f.write(summary_content)
+            Path(summary_path).write_text(summary_content, encoding='utf-8')
             click.echo(f"📊 Summary saved to: {summary_path}")
 
         click.echo(f"✅ Notes saved to: {output_path}")
-        click.echo(f"📈 Generated notes from {len(all_chunks)} chunks")
+        click.echo(f"📈 Generated notes from {len(notes)} chunks")
 
     except Exception as e:
         click.echo(f"❌ Error processing PDF: {str(e)}", err=True)
@@ -252,23 +258,151 @@ def main(pdf_path, model, chunk_size, overlap, output_dir, obsidian, device, pag
         sys.exit(1)
 
 
-def parse_pages(pages_str):
-    """Parse page specification like '1-10' or '5,7,9-12' into list of page numbers."""
-    pages = []
-    parts = pages_str.split(',')
+def iter_text_chunks(pdf_path, start_page, end_page, chunk_size, overlap, extract_workers=None):
+    """Yield token-based chunks section by section as the PDF is extracted."""
+    chunker = TextChunker(max_chunk_size=chunk_size, overlap_size=overlap)
 
-    for part in parts:
-        part = part.strip()
-        if '-' in part:
-            start, end = map(int, part.split('-'))
-            pages.extend(range(start, end + 1))
+    with PDFExtractor(pdf_path) as extractor:
+        if start_page is not None:
+            # Extract specified page range as one continuous block
+            text = extractor.get_text_by_pages_parallel(
+                start_page - 1,
+                end_page,
+                max_workers=extract_workers
+            )
+            sections = [ExtractedText(
+                content=text,
+                page_number=start_page,
+                chapter_title=""
+            )] if text.strip() else []
         else:
-            pages.append(int(part))
+            sections = extractor.iter_sections()
 
-    return sorted(list(set(pages)))
+        for section in sections:
+            yield from chunker.smart_chunk(
+                section.content,
+                [section.page_number],
+                section.chapter_title
+            )
+
+
+def iter_in_background(iterable, maxsize=32):
+    """
+    Consume `iterable` in a producer thread, yielding its items as they arrive.
+
+    The bounded queue keeps the producer at most `maxsize` items ahead of the
+    consumer. Exceptions raised by the producer are re-raised here.
+    """
+    items = queue.Queue(maxsize=maxsize)
+    done = object()
+    errors = []
+
+    def producer():
+        try:
+            for item in iterable:
+                items.put(item)
+        except Exception as e:
+            errors.append(e)
+        finally:
+            items.put(done)
+
+    threading.Thread(target=producer, daemon=True).start()
+
+    while (item := items.get()) is not done:
+        yield item
+
+    if errors:
+        raise errors[0]
+
+
+async def generate_notes_concurrently(note_generator, chunks, concurrency, pbar):
+    """
+    Generate notes for all chunks with at most `concurrency` requests in flight.
+
+    `chunks` may be a lazy iterator; requests are dispatched as chunks become
+    available. Notes are returned in the same order as the chunks, and the
+    progress bar is updated as each request completes. Generators that can
+    pack short chunks into a shared request (the Claude API) are sent each
+    run of consecutive packable chunks as one group. Chunks repeating an
+    earlier chunk's text are generated once and share its note.
+    """
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+    is_packable = getattr(note_generator, 'is_packable', None)
+    pack_max_chars = getattr(note_generator, 'pack_max_chars', 0)
+
+    async def guarded(group):
+        async with semaphore:
+            if len(group) == 1:
+                group_notes = [await note_generator.generate_note_async(group[0])]
+            else:
+                group_notes = await note_generator.generate_group_async(group)
+        pbar.update(len(group))
+        return group_notes
+
+    # id(group) -> task generating that group's notes
+    tasks = {}
+    # (group, index in group, chunk) locating each chunk's note, in chunk order
+    slots = []
+    # Text -> slot of its first copy
+    first_slot = {}
+    # Run of short chunks waiting to be sent together
+    packed = []
+    packed_chars = 0
+
+    def dispatch(group):
+        tasks[id(group)] = asyncio.create_task(guarded(group))
+
+    chunk_iter = iter(chunks)
+    try:
+        # Pull chunks off the event loop, since a lazy source may block
+        while (chunk := await asyncio.to_thread(next, chunk_iter, None)) is not None:
+            # Repeated text (boilerplate, license pages) only needs one request
+            key = (chunk.chapter_title, getattr(chunk, 'context_prefix_len', 0), chunk.content)
+            if key in first_slot:
+                slots.append((*first_slot[key], chunk))
+                pbar.update(1)
+                continue
+
+            if is_packable is None or pack_max_chars <= 0 or not is_packable(chunk):
+                if packed:
+                    dispatch(packed)
+                    packed, packed_chars = [], 0
+                group = [chunk]
+                first_slot[key] = (group, 0)
+                slots.append((group, 0, chunk))
+                dispatch(group)
+                continue
+
+            if packed and packed_chars + len(chunk.content) > pack_max_chars:
+                dispatch(packed)
+                packed, packed_chars = [], 0
+            first_slot[key] = (packed, len(packed))
+            slots.append((*first_slot[key], chunk))
+            packed.append(chunk)
+            packed_chars += len(chunk.content)
+
+        if packed:
+            dispatch(packed)
+
+        results = dict(zip(tasks, await asyncio.gather(*tasks.values())))
+        notes = []
+        for group, index, chunk in slots:
+            note = results[id(group)][index]
+            if group[index] is not chunk:
+                # Same text elsewhere in the book; point the copy at this chunk
+                note = replace(
+                    note,
+                    source_chunk_ids=[chunk.chunk_id],
+                    source_pages=list(chunk.source_pages)
+                )
+            notes.append(note)
+        return notes
+    finally:
+        # Connection pools belong to this event loop; release them before it closes
+        aclose = getattr(note_generator, 'aclose', None)
+        if aclose is not None:
+            await aclose()
 
-def kevstest():
-    Path("")
 
 if __name__ == '__main__':
     main()
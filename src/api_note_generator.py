@@ -1,17 +1,169 @@
+import asyncio
 import os
-from typing import List
-from anthropic import Anthropic
+import random
+import re
+import time
+from functools import lru_cache
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import httpx
+from anthropic import Anthropic, APIConnectionError, APIStatusError, AsyncAnthropic, RateLimitError
 from dotenv import load_dotenv
-from dataclasses import dataclass
+from tqdm import tqdm
+from dataclasses import dataclass, replace
+from .rate_limiter import RateLimiter
 from .text_chunker import TextChunk
 
 
+# Instructions sent with every request. Kept byte-for-byte stable so the API's
+# prompt cache can reuse it across chunks.
+BASE_PROMPT = """Create comprehensive, detailed technical notes from the following text. Your goal is to capture substantive content, not just surface-level summaries.
+
+IMPORTANT: Focus on depth over brevity. Include:
+
+**Definitions & Terminology:**
+- Define all key terms, concepts, and specialized vocabulary
+- Explain what things ARE, not just that they exist
+- Include formal definitions where provided
+
+**Concepts & Theories:**
+- Explain the core ideas and how they work
+- Describe the reasoning, logic, or proof behind concepts
+- Include the "why" and "how", not just the "what"
+- Capture theoretical frameworks and mental models
+
+**Technical Details:**
+- Preserve specific technical explanations, mechanisms, and processes
+- Include algorithms, formulas, equations, and their explanations
+- Document code examples with context about what they demonstrate
+- Note important parameters, constraints, or conditions
+
+**Relationships & Context:**
+- Show how concepts connect to and build upon each other
+- Explain cause-and-effect relationships
+- Note comparisons, contrasts, or trade-offs discussed
+- Identify prerequisites or dependencies
+
+**Examples & Applications:**
+- Include concrete examples that illustrate abstract concepts
+- Document use cases, scenarios, or practical applications
+- Note any warnings, common mistakes, or edge cases
+
+**Format Guidelines:**
+- Use paragraph form for complex explanations that need flow
+- Use bullet points for lists, steps, or distinct items
+- Use headers (###) to organize major topics
+- Preserve the logical structure and progression of ideas
+- Cut marketing fluff, redundant introductions, and filler, but keep substantive content
+
+Write notes as if for a graduate student who needs to deeply understand the material, not just get a high-level overview."""
+
+# A note line worth keeping: more than 5 characters once stripped, and not
+# meta-text echoed from the prompt. Captures the stripped line.
+_NOTE_LINE_RE = re.compile(
+    r"^[^\S\n]*(?!Chapter:|Text to summarize:)(\S.{4,}\S)[^\S\n]*$",
+    re.MULTILINE
+)
+
+# Words marking a sentence worth keeping in a fallback note. Matched anywhere in
+# the sentence, case-insensitively, by a single regex built from the set.
+_KEYWORDS = frozenset({
+    'important', 'key', 'main', 'concept', 'algorithm',
+    'method', 'approach', 'technique', 'definition', 'theorem',
+})
+_KEYWORD_RE = re.compile("|".join(sorted(_KEYWORDS)), re.IGNORECASE)
+
+# Tool the model is made to call when structured output is enabled. Each field
+# matches a section of BASE_PROMPT.
+_NOTE_SECTIONS = (
+    ("definitions", "Definitions & Terminology"),
+    ("concepts", "Concepts & Theories"),
+    ("technical_details", "Technical Details"),
+    ("relationships", "Relationships & Context"),
+    ("examples", "Examples & Applications"),
+)
+_NOTE_TOOL = {
+    "name": "emit_note",
+    "description": "Record the notes for the text, grouped by section.",
+    "input_schema": {
+        "type": "object",
+        "properties": {
+            field: {
+                "type": "array",
+                "items": {"type": "string"},
+                "description": f"{title} (one entry per point, markdown allowed)"
+            }
+            for field, title in _NOTE_SECTIONS
+        },
+        "required": [field for field, _ in _NOTE_SECTIONS]
+    }
+}
+
+# Marks the start of each note in a packed (multi-chunk) response
+_PACKED_NOTE_RE = re.compile(r"^===NOTE id=(\d+)===[ \t]*$", re.MULTILINE)
+
+# User message templates, filled in per chunk by _create_note_prompt
+_PROMPT_WITH_CHAPTER = "Chapter: {chapter_title}\n\nText to analyze:\n\n{text}"
+_PROMPT_NO_CHAPTER = "Text to analyze:\n\n{text}"
+_CONTEXT_TEMPLATE = (
+    "Context (already covered in earlier notes - use it for continuity "
+    "only, do not take notes on it):\n\n{context}\n\n"
+    "New material (take notes on this only):\n\n{text}"
+)
+_PACKED_PROMPT_HEADER = (
+    "Below are {count} separate chunks of text. Take notes on each chunk "
+    "independently. Return one note per chunk, each starting with a line of the "
+    "form ===NOTE id=N=== where N is the chunk's id.\n\n"
+)
+_PACKED_CHUNK_TEMPLATE = "<CHUNK id={id}>\n{prompt}\n</CHUNK>"
+
+# Single-chunk requests ask for this marker and stop on it, so the model can't
+# run on into commentary after the notes
+_END_MARKER = "---END---"
+_END_INSTRUCTION = f"\n\nEnd your notes with the line {_END_MARKER}"
+
+# Defaults for the generation methods. Callers usually rely on them, so the
+# cache can't see them in its keys; they're folded into prompt_version instead
+_DEFAULT_TEMPERATURE = 0.7
+_DEFAULT_MAX_TOKENS = 4096
+
+
+@lru_cache(maxsize=None)
+def _load_api_key():
+    """Read CLAUDE_KEY, loading .env once per process."""
+    load_dotenv()
+    return os.getenv('CLAUDE_KEY')
+
+
+# Synchronous clients by API key, shared so generators created repeatedly
+# (notebooks, scripts) reuse one client and its connection pool. Each is
+# reference-counted and closed when the last generator using it closes.
+_clients: Dict[str, Anthropic] = {}
+_client_refs: Dict[str, int] = {}
+
+
+def _get_client(api_key: str) -> Anthropic:
+    client = _clients.get(api_key)
+    if client is None:
+        # Retries are handled by APIBasedNoteGenerator, not the SDK
+        client = _clients[api_key] = Anthropic(api_key=api_key, max_retries=0)
+    _client_refs[api_key] = _client_refs.get(api_key, 0) + 1
+    return client
+
+
+def _release_client(api_key: str) -> None:
+    _client_refs[api_key] -= 1
+    if _client_refs[api_key] == 0:
+        del _client_refs[api_key]
+        _clients.pop(api_key).close()
+
+
 @dataclass
 class GeneratedNote:
     content: str
     source_chunk_ids: List[int]
     source_pages: List[int]
     chapter_title: str = ""
+    is_fallback: bool = False  # True when generation failed and a heuristic note was used
 
 
 class APIBasedNoteGenerator:
@@ -20,7 +172,41 @@ class APIBasedNoteGenerator:
     This is useful when GPU resources are limited.
     """
 
-    def __init__(self, model_name: str = "claude-3-5-sonnet-20241022"):
+    # Bump when the prompt, or how requests are built from a chunk (e.g. the
+    # max_tokens cap in _build_request), changes so cached notes are regenerated
+    prompt_version = "3"
+
+    # Attempts per chunk when the API still answers 429 despite the limiter
+    max_rate_limit_retries = 3
+
+    # Attempts per chunk for transient failures (connection errors, 408, 5xx,
+    # 529 overloaded), with jittered exponential backoff between them
+    max_transient_retries = 4
+    backoff_base = 1.0
+    backoff_max = 30.0
+
+    # Short or list-heavy chunks go to this cheaper, faster model when routing is on
+    routing_model = "claude-3-5-haiku-20241022"
+    routing_max_chars = 800
+
+    # Seconds to wait for the first streamed token before giving up on a request
+    first_token_timeout = 15
+
+    # Prompts estimated above max_prompt_tokens are cut to max_prompt_chars; output
+    # is capped so prompt + max_tokens stays inside the context window
+    max_prompt_tokens = 8000
+    max_prompt_chars = 32000
+    context_window = 200_000
+
+    # Chunks shorter than this are packed together into shared requests, up to
+    # pack_max_chars of chunk text per request (see generate_group_async)
+    pack_chunk_chars = 600
+    pack_max_chars = 6000
+
+    def __init__(self, model_name: str = "claude-3-5-sonnet-20241022",
+                 tpm: int = 400_000, rpm: int = 50,
+                 enable_model_routing: bool = True,
+                 structured_output: bool = False):
         """
         Initialize the API-based note generator.
 
@@ -28,23 +214,45 @@ class APIBasedNoteGenerator:
             model_name: Claude model to use. Options:
                 - claude-3-5-sonnet-20241022 (recommended for quality)
                 - claude-3-5-haiku-20241022 (faster, more economical)
+            tpm: Tokens per minute allowed for concurrent requests
+            rpm: Requests per minute allowed for concurrent requests
+            enable_model_routing: Send short or list-heavy chunks to
+                routing_model instead of model_name
+            structured_output: Have the model return sections through the
+                emit_note tool and format them locally, instead of free text
         """
-        load_dotenv()
-        api_key = os.getenv('CLAUDE_KEY')
+        api_key = _load_api_key()
 
         if not api_key:
+            # Let a later attempt pick up a fixed .env
+            _load_api_key.cache_clear()
             raise ValueError(
                 "CLAUDE_KEY not found in environment variables. "
                 "Please add it to your .env file."
             )
 
-        self.client = Anthropic(api_key=api_key)
+        self._api_key = api_key
+        self.client = _get_client(api_key)
+        # Created on first use in each event loop (see _get_async_client)
+        self.aclient = None
+        self._aclient_loop = None
+        self.limiter = RateLimiter(tpm=tpm, rpm=rpm)
         self.model_name = model_name
+        self.enable_model_routing = enable_model_routing
+        self.structured_output = structured_output
+        # Default request settings and prompt limits shape the notes too
+        self.prompt_version = (
+            f"{self.prompt_version}:t={_DEFAULT_TEMPERATURE}:max={_DEFAULT_MAX_TOKENS}"
+            f":in={self.max_prompt_tokens}/{self.max_prompt_chars}"
+        )
+        if structured_output:
+            # Notes come out in a different format; don't reuse cached free-text notes
+            self.prompt_version = f"{self.prompt_version}+tool"
         print(f"✅ Initialized Claude API with model: {model_name}")
 
     def generate_note_from_chunk(self, chunk: TextChunk,
-                                  temperature: float = 0.7,
-                                  max_tokens: int = 4096) -> GeneratedNote:
+                                  temperature: float = _DEFAULT_TEMPERATURE,
+                                  max_tokens: int = _DEFAULT_MAX_TOKENS) -> GeneratedNote:
         """
         Generate a structured note from a text chunk using Claude API.
 
@@ -56,115 +264,364 @@ class APIBasedNoteGenerator:
         Returns:
             GeneratedNote with formatted content
         """
-        prompt = self._create_note_prompt(chunk.content, chunk.chapter_title)
+        params = self._build_request(chunk, temperature, max_tokens)
 
         try:
-            message = self.client.messages.create(
-                model=self.model_name,
-                max_tokens=max_tokens,
-                temperature=temperature,
-                messages=[
-                    {
-                        "role": "user",
-                        "content": prompt
-                    }
-                ]
-            )
+            for attempt in range(1, self.max_transient_retries + 1):
+                try:
+                    message = self.client.messages.create(**params)
+                    break
+                except (APIConnectionError, APIStatusError) as e:
+                    if attempt == self.max_transient_retries or not self._is_transient(e):
+                        raise
+                    delay = self._backoff_delay(attempt)
+                    if isinstance(e, RateLimitError):
+                        delay = max(delay, self._retry_after(e))
+                    time.sleep(delay)
+
+            if "tools" in params:
+                return self._note_from_text(chunk, self._format_tool_note(message), clean=False)
+            # A response may hold several blocks; only text blocks are note content
+            response_text = "".join(block.text for block in message.content if block.type == "text")
+            return self._note_from_text(chunk, response_text)
+
+        except Exception as e:
+            return self._fallback_for_chunk(chunk, e)
+
+    async def generate_note_async(self, chunk: TextChunk,
+                                  temperature: float = _DEFAULT_TEMPERATURE,
+                                  max_tokens: int = _DEFAULT_MAX_TOKENS,
+                                  on_delta: Optional[Callable[[str], None]] = None) -> GeneratedNote:
+        """
+        Generate a note without blocking the event loop.
 
-            # Extract text from response
-            note_content = message.content[0].text.strip()
-            note_content = self._clean_generated_note(note_content)
+        Uses the AsyncAnthropic client, so several chunks can be in flight at
+        once when awaited together (e.g. with asyncio.gather). The response is
+        streamed; if no text arrives within first_token_timeout seconds the
+        request is abandoned and a fallback note is used.
 
-            return GeneratedNote(
-                content=note_content,
-                source_chunk_ids=[chunk.chunk_id],
-                source_pages=chunk.source_pages,
-                chapter_title=chunk.chapter_title
-            )
+        Args:
+            chunk: TextChunk containing the content to process
+            temperature: Controls randomness (0.7 = balanced, lower = more focused)
+            max_tokens: Maximum tokens to generate
+            on_delta: Optional callback receiving each piece of text as it arrives
+
+        Returns:
+            GeneratedNote with formatted content
+        """
+        params = self._build_request(chunk, temperature, max_tokens)
+
+        try:
+            text = await self._request_text(params, on_delta)
+            # Structured notes are formatted locally and need no cleaning
+            return self._note_from_text(chunk, text, clean="tools" not in params)
 
         except Exception as e:
-            print(f"Error generating note for chunk {chunk.chunk_id}: {e}")
-            return GeneratedNote(
-                content=self._create_fallback_note(chunk.content),
-                source_chunk_ids=[chunk.chunk_id],
-                source_pages=chunk.source_pages,
-                chapter_title=chunk.chapter_title
-            )
+            return self._fallback_for_chunk(chunk, e)
 
-    def _create_note_prompt(self, text: str, chapter_title: str = "") -> str:
-        """Create an optimized prompt for Claude API."""
-        base_prompt = """Create comprehensive, detailed technical notes from the following text. Your goal is to capture substantive content, not just surface-level summaries.
+    async def _request_text(self, params: Dict[str, Any],
+                            on_delta: Optional[Callable[[str], None]] = None) -> str:
+        """
+        Send a rate-limited request, retrying on 429 and transient errors, and
+        return the response text.
 
-IMPORTANT: Focus on depth over brevity. Include:
+        429s and transient failures are counted separately, so one doesn't use
+        up the other's retries. For tool requests (structured output) the text
+        is the formatted tool input.
+        """
+        est_tokens = self._estimate_tokens(params)
+        rate_limited = 0
+        failures = 0
+
+        while True:
+            await self.limiter.acquire(est_tokens)
+            try:
+                if "tools" in params:
+                    return await self._stream_tool_note(params)
+                return await self._stream_text(params, on_delta)
+            except RateLimitError as e:
+                rate_limited += 1
+                if rate_limited >= self.max_rate_limit_retries:
+                    raise
+                # Hold back other requests too, then wait as instructed
+                self.limiter.drain()
+                await asyncio.sleep(self._retry_after(e))
+            except (APIConnectionError, APIStatusError) as e:
+                failures += 1
+                if failures >= self.max_transient_retries or not self._is_transient(e):
+                    raise
+                await asyncio.sleep(self._backoff_delay(failures))
+
+    @staticmethod
+    def _is_transient(error: Exception) -> bool:
+        """Whether a failed request is worth retrying."""
+        if isinstance(error, APIStatusError):
+            return error.status_code in (408, 429) or error.status_code >= 500
+        # Connection errors and timeouts
+        return isinstance(error, APIConnectionError)
+
+    def _backoff_delay(self, attempt: int) -> float:
+        """Seconds to wait after the given failed attempt (1-based), with jitter."""
+        return min(self.backoff_max, self.backoff_base * 2 ** attempt) + random.uniform(0, self.backoff_base)
+
+    async def _stream_text(self, params: Dict[str, Any],
+                           on_delta: Optional[Callable[[str], None]] = None) -> str:
+        """Stream a response and return its full text."""
+        buffer = []
+        async with self._get_async_client().messages.stream(**params) as stream:
+            text_stream = stream.text_stream.__aiter__()
+
+            # Only the first token is timed; once text flows, long notes may take a while
+            try:
+                delta = await asyncio.wait_for(text_stream.__anext__(), timeout=self.first_token_timeout)
+            except StopAsyncIteration:
+                return ""
+            except asyncio.TimeoutError:
+                raise TimeoutError(f"no response within {self.first_token_timeout}s")
+
+            while True:
+                buffer.append(delta)
+                if on_delta is not None:
+                    on_delta(delta)
+                try:
+                    delta = await text_stream.__anext__()
+                except StopAsyncIteration:
+                    break
+
+        return "".join(buffer)
+
+    async def _stream_tool_note(self, params: Dict[str, Any]) -> str:
+        """Stream a tool-use response and return the formatted note."""
+        async with self._get_async_client().messages.stream(**params) as stream:
+            events = stream.__aiter__()
+            try:
+                await asyncio.wait_for(events.__anext__(), timeout=self.first_token_timeout)
+            except StopAsyncIteration:
+                pass
+            except asyncio.TimeoutError:
+                raise TimeoutError(f"no response within {self.first_token_timeout}s")
+
+            message = await stream.get_final_message()
+
+        return self._format_tool_note(message)
+
+    @staticmethod
+    def _format_tool_note(message) -> str:
+        """Format the emit_note tool input from a response as markdown sections."""
+        tool_input = next(
+            block.input for block in message.content
+            if block.type == "tool_use" and block.name == _NOTE_TOOL["name"]
+        )
+
+        sections = []
+        for field, title in _NOTE_SECTIONS:
+            items = [item.strip() for item in tool_input.get(field) or [] if item.strip()]
+            if items:
+                sections.append(f"### {title}\n" + "\n".join(f"- {item}" for item in items))
+
+        return "\n\n".join(sections)
+
+    @staticmethod
+    def _estimate_tokens(params: Dict[str, Any]) -> int:
+        """Rough token count of a request: ~4 characters per input token plus max output."""
+        prompt_chars = sum(len(block["text"]) for block in params["system"])
+        prompt_chars += sum(len(m["content"]) for m in params["messages"])
+        return prompt_chars // 4 + params["max_tokens"]
+
+    @staticmethod
+    def _retry_after(error: RateLimitError) -> float:
+        """Seconds to wait before retrying, from the Retry-After header if present."""
+        try:
+            return max(0.0, float(error.response.headers.get("retry-after", 1)))
+        except (TypeError, ValueError):
+            return 1.0
 
-**Definitions & Terminology:**
-- Define all key terms, concepts, and specialized vocabulary
-- Explain what things ARE, not just that they exist
-- Include formal definitions where provided
+    def _get_async_client(self) -> AsyncAnthropic:
+        """
+        Return an AsyncAnthropic client bound to the running event loop.
 
-**Concepts & Theories:**
-- Explain the core ideas and how they work
-- Describe the reasoning, logic, or proof behind concepts
-- Include the "why" and "how", not just the "what"
-- Capture theoretical frameworks and mental models
+        The client keeps a pool of HTTP/2 keep-alive connections, so requests
+        after the first skip the TCP/TLS handshake.
+        """
+        # httpx connection pools can't be reused once their event loop closes,
+        # so each asyncio.run() gets its own client
+        loop = asyncio.get_running_loop()
+        if self.aclient is None or self._aclient_loop is not loop:
+            http_client = httpx.AsyncClient(
+                http2=True,
+                limits=httpx.Limits(
+                    max_connections=32,
+                    max_keepalive_connections=32,
+                    keepalive_expiry=60
+                )
+            )
+            self.aclient = AsyncAnthropic(
+                api_key=self._api_key,
+                http_client=http_client,
+                max_retries=0
+            )
+            self._aclient_loop = loop
+        return self.aclient
 
-**Technical Details:**
-- Preserve specific technical explanations, mechanisms, and processes
-- Include algorithms, formulas, equations, and their explanations
-- Document code examples with context about what they demonstrate
-- Note important parameters, constraints, or conditions
+    async def aclose(self):
+        """Close the async client's connection pool. Call before the event loop ends."""
+        if self.aclient is not None:
+            await self.aclient.close()
+            self.aclient = None
+            self._aclient_loop = None
 
-**Relationships & Context:**
-- Show how concepts connect to and build upon each other
-- Explain cause-and-effect relationships
-- Note comparisons, contrasts, or trade-offs discussed
-- Identify prerequisites or dependencies
+    def close(self):
+        """
+        Release this generator's synchronous client.
 
-**Examples & Applications:**
-- Include concrete examples that illustrate abstract concepts
-- Document use cases, scenarios, or practical applications
-- Note any warnings, common mistakes, or edge cases
+        The shared client is closed once no other generator uses it. When no
+        clients remain, the cached API key is forgotten too, so the next
+        generator created reloads .env.
+        """
+        if self.client is None:
+            return
+        self.client = None
+        _release_client(self._api_key)
+        if not _clients:
+            _load_api_key.cache_clear()
+
+    def _split_chunk(self, chunk: TextChunk) -> Tuple[str, str]:
+        """
+        Split chunk content into (context, text).
 
-**Format Guidelines:**
-- Use paragraph form for complex explanations that need flow
-- Use bullet points for lists, steps, or distinct items
-- Use headers (###) to organize major topics
-- Preserve the logical structure and progression of ideas
-- Cut marketing fluff, redundant introductions, and filler, but keep substantive content
+        Text shared with the previous (overlapping) chunk is passed as context
+        only, so the model doesn't take notes on it twice.
+        """
+        prefix_len = getattr(chunk, 'context_prefix_len', 0)
+        return chunk.content[:prefix_len], chunk.content[prefix_len:]
+
+    def _select_model(self, chunk: TextChunk) -> str:
+        """Pick the model for a chunk: simple chunks don't need the larger model."""
+        if not self.enable_model_routing:
+            return self.model_name
+
+        content = chunk.content
+        # Short passages, or ones that are mostly short lines (lists, references)
+        if len(content) < self.routing_max_chars or content.count('\n') > len(content) / 40:
+            return self.routing_model
+        return self.model_name
+
+    def _build_request(self, chunk: TextChunk, temperature: float, max_tokens: int) -> Dict[str, Any]:
+        """Build the messages.create() arguments for a chunk."""
+        context, text = self._split_chunk(chunk)
+        prompt = self._create_note_prompt(text, chunk.chapter_title, context)
+
+        # Notes are shorter than the (new) text, so allow at most twice its
+        # token count (~4 chars per token, so len(text) // 2)
+        max_tokens = min(max_tokens, max(512, len(text) // 2))
+        params = self._request_params(self._select_model(chunk), prompt, temperature, max_tokens)
+
+        if self.structured_output:
+            params["tools"] = [_NOTE_TOOL]
+            params["tool_choice"] = {"type": "tool", "name": _NOTE_TOOL["name"]}
+        else:
+            # Added after budgeting so truncating a long prompt can't cut it off
+            params["messages"][0]["content"] += _END_INSTRUCTION
+            params["stop_sequences"] = [_END_MARKER]
+
+        return params
+
+    def _request_params(self, model: str, prompt: str, temperature: float, max_tokens: int) -> Dict[str, Any]:
+        """Build the messages.create() arguments for a user prompt."""
+        prompt, max_tokens = self._budget(prompt, max_tokens)
+
+        return {
+            "model": model,
+            "max_tokens": max_tokens,
+            "temperature": temperature,
+            "system": [
+                {
+                    "type": "text",
+                    "text": BASE_PROMPT,
+                    "cache_control": {"type": "ephemeral"}
+                }
+            ],
+            "messages": [
+                {
+                    "role": "user",
+                    "content": prompt
+                }
+            ]
+        }
+
+    def _budget(self, prompt: str, max_tokens: int) -> Tuple[str, int]:
+        """
+        Cap an over-long prompt and the output budget before sending.
 
-Write notes as if for a graduate student who needs to deeply understand the material, not just get a high-level overview."""
+        Oversized chunks (bad chunker output) are slow and summarize poorly, so
+        the tail is dropped rather than paying for a long-context call.
+        """
+        approx_tokens = len(prompt) // 4
+        if approx_tokens > self.max_prompt_tokens:
+            prompt = prompt[:self.max_prompt_chars] + "\n[...truncated...]"
+            approx_tokens = len(prompt) // 4
+
+        return prompt, max(1, min(max_tokens, self.context_window - approx_tokens))
+
+    def _note_from_text(self, chunk: TextChunk, response_text: str, clean: bool = True) -> GeneratedNote:
+        """Turn the text of an API response into a GeneratedNote."""
+        # Cleaning strips every line itself, so the text isn't copied by strip() first
+        if clean:
+            note_content = self._clean_generated_note(response_text)
+        else:
+            note_content = response_text.strip()
+
+        return GeneratedNote(
+            content=note_content,
+            source_chunk_ids=[chunk.chunk_id],
+            source_pages=chunk.source_pages,
+            chapter_title=chunk.chapter_title
+        )
+
+    def _fallback_for_chunk(self, chunk: TextChunk, error: BaseException) -> GeneratedNote:
+        """Report a failed request and build a heuristic note instead."""
+        tqdm.write(f"Error generating note for chunk {chunk.chunk_id}: {error}")
+        _, text = self._split_chunk(chunk)
+
+        return GeneratedNote(
+            content=self._create_fallback_note(text),
+            source_chunk_ids=[chunk.chunk_id],
+            source_pages=chunk.source_pages,
+            chapter_title=chunk.chapter_title,
+            is_fallback=True
+        )
+
+    def _create_note_prompt(self, text: str, chapter_title: str = "", context: str = "") -> str:
+        """
+        Create the user message for Claude API.
+
+        The instructions are sent separately as the cached system prompt
+        (BASE_PROMPT); this only holds the chapter and the text. Context (text
+        the previous chunk already covered) is included for continuity, and
+        the model is told to note only the new text.
+        """
+
+        if context:
+            text = _CONTEXT_TEMPLATE.format(context=context, text=text)
 
         if chapter_title:
-            return f"{base_prompt}\n\nChapter: {chapter_title}\n\nText to analyze:\n\n{text}"
+            return _PROMPT_WITH_CHAPTER.format(chapter_title=chapter_title, text=text)
         else:
-            return f"{base_prompt}\n\nText to analyze:\n\n{text}"
+            return _PROMPT_NO_CHAPTER.format(text=text)
 
     def _clean_generated_note(self, note: str) -> str:
         """Clean up the generated note by removing unnecessary prefixes."""
-        lines = note.split('\n')
-        cleaned_lines = []
-
-        for line in lines:
-            line = line.strip()
-            # Keep all meaningful content, just remove meta-text
-            if (line and
-                not line.startswith("Chapter:") and
-                not line.startswith("Text to summarize:") and
-                len(line) > 5):
-                cleaned_lines.append(line)
-
-        return '\n'.join(cleaned_lines)
+        # Keep all meaningful content, just remove meta-text and blank lines
+        return '\n'.join(_NOTE_LINE_RE.findall(note))
 
     def _create_fallback_note(self, text: str) -> str:
         """Create a simple fallback note if API call fails."""
-        sentences = text.split('. ')
+        # Only the first five sentences are looked at, so don't split the rest
+        sentences = text.split('. ', 5)
         key_sentences = []
 
         for sentence in sentences[:5]:
-            if (len(sentence) > 20 and
-                any(keyword in sentence.lower() for keyword in
-                    ['important', 'key', 'main', 'concept', 'algorithm',
-                     'method', 'approach', 'technique', 'definition', 'theorem'])):
+            if len(sentence) > 20 and _KEYWORD_RE.search(sentence):
                 key_sentences.append(sentence.strip())
 
         if not key_sentences and sentences:
@@ -174,26 +631,188 @@ Write notes as if for a graduate student who needs to deeply understand the mate
 
     def generate_notes_batch(self,
                             chunks: List[TextChunk],
-                            temperature: float = 0.7,
-                            max_tokens: int = 4096) -> List[GeneratedNote]:
+                            temperature: float = _DEFAULT_TEMPERATURE,
+                            max_tokens: int = _DEFAULT_MAX_TOKENS,
+                            concurrency: int = 8,
+                            pack_max_chars: Optional[int] = None) -> List[GeneratedNote]:
         """
         Generate notes for a batch of chunks.
 
+        Requests are sent concurrently, with at most `concurrency` in flight.
+        Chunks with identical text are only generated once. Runs of
+        consecutive short chunks are packed into a single request that
+        returns one note per chunk, saving per-request overhead.
+
         Args:
             chunks: List of TextChunk objects to process
             temperature: Controls randomness (lower = more focused)
             max_tokens: Maximum tokens per note
+            concurrency: Maximum number of simultaneous API requests
+            pack_max_chars: Maximum characters of chunk text per packed
+                request (default: self.pack_max_chars; 0 disables packing)
 
         Returns:
-            List of GeneratedNote objects
+            List of GeneratedNote objects, in the same order as chunks
         """
+        return asyncio.run(self._generate_notes_batch_async(
+            chunks,
+            temperature,
+            max_tokens,
+            concurrency,
+            pack_max_chars
+        ))
+
+    async def _generate_notes_batch_async(self,
+                                          chunks: List[TextChunk],
+                                          temperature: float,
+                                          max_tokens: int,
+                                          concurrency: int,
+                                          pack_max_chars: Optional[int]) -> List[GeneratedNote]:
+        semaphore = asyncio.Semaphore(max(1, concurrency))
+
+        # Repeated text (boilerplate, template pages) only needs one request
+        first_index = {}
+        unique_chunks = []
+        source_index = []
+        for chunk in chunks:
+            key = (chunk.chapter_title, getattr(chunk, 'context_prefix_len', 0), chunk.content)
+            if key not in first_index:
+                first_index[key] = len(unique_chunks)
+                unique_chunks.append(chunk)
+            source_index.append(first_index[key])
+
+        if pack_max_chars is None:
+            pack_max_chars = self.pack_max_chars
+        groups = self._pack_chunks(unique_chunks, pack_max_chars)
+
+        async def guarded(group: List[TextChunk], pbar: tqdm) -> List[GeneratedNote]:
+            async with semaphore:
+                group_notes = await self.generate_group_async(group, temperature, max_tokens)
+            pbar.update(len(group))
+            return group_notes
+
+        try:
+            # tqdm throttles redraws, unlike a print per request
+            with tqdm(total=len(unique_chunks), desc="Notes", unit="chunk", mininterval=0.5) as pbar:
+                results = await asyncio.gather(
+                    *(guarded(group, pbar) for group in groups),
+                    return_exceptions=True
+                )
+        finally:
+            await self.aclose()
+
+        unique_notes = []
+        for group, result in zip(groups, results):
+            if isinstance(result, BaseException):
+                unique_notes.extend(self._fallback_for_chunk(chunk, result) for chunk in group)
+            else:
+                unique_notes.extend(result)
+
         notes = []
-        for i, chunk in enumerate(chunks):
-            print(f"Processing chunk {i+1}/{len(chunks)} (Page {chunk.source_pages[0] if chunk.source_pages else 'Unknown'})")
-            note = self.generate_note_from_chunk(
-                chunk,
-                temperature=temperature,
-                max_tokens=max_tokens
-            )
+        for chunk, i in zip(chunks, source_index):
+            note = unique_notes[i]
+            if unique_chunks[i] is not chunk:
+                # Same text elsewhere in the book; point the copy at this chunk
+                note = replace(
+                    note,
+                    source_chunk_ids=[chunk.chunk_id],
+                    source_pages=list(chunk.source_pages)
+                )
             notes.append(note)
         return notes
+
+    def _pack_chunks(self, chunks: List[TextChunk], max_chars: int) -> List[List[TextChunk]]:
+        """
+        Greedily group consecutive short chunks, up to max_chars of text per group.
+
+        Chunks that aren't packable (see is_packable) get a group of their own.
+        A max_chars of 0 or less disables packing.
+        """
+        if max_chars <= 0:
+            return [[chunk] for chunk in chunks]
+
+        groups = []
+        current = []
+        current_chars = 0
+
+        for chunk in chunks:
+            size = len(chunk.content)
+            if size > max_chars or not self.is_packable(chunk):
+                if current:
+                    groups.append(current)
+                    current, current_chars = [], 0
+                groups.append([chunk])
+                continue
+
+            if current and current_chars + size > max_chars:
+                groups.append(current)
+                current, current_chars = [], 0
+            current.append(chunk)
+            current_chars += size
+
+        if current:
+            groups.append(current)
+
+        return groups
+
+    def is_packable(self, chunk: TextChunk) -> bool:
+        """
+        Whether a chunk may share a request with other short chunks.
+
+        Chunks of pack_chunk_chars or more and chunks carrying overlap context
+        are sent alone. Nothing is packed with structured output: packed
+        requests return free text split on markers, not an emit_note call.
+        """
+        return (not self.structured_output
+                and len(chunk.content) < self.pack_chunk_chars
+                and not getattr(chunk, 'context_prefix_len', 0))
+
+    async def generate_group_async(self, chunks: List[TextChunk],
+                                   temperature: float = _DEFAULT_TEMPERATURE,
+                                   max_tokens: int = _DEFAULT_MAX_TOKENS) -> List[GeneratedNote]:
+        """
+        Generate notes for a group of chunks, in one request when there are several.
+
+        The chunks should be packable (see is_packable). Returns one note per
+        chunk, in order.
+        """
+        if len(chunks) > 1:
+            prompt = self._create_packed_prompt(chunks)
+            # Packed chunks are all short, so they route like any one of them
+            params = self._request_params(self._select_model(chunks[0]), prompt, temperature, max_tokens)
+            try:
+                bodies = self._split_packed_response(await self._request_text(params), len(chunks))
+            except Exception as e:
+                tqdm.write(f"Error generating packed notes for chunks {chunks[0].chunk_id}-{chunks[-1].chunk_id}: {e}")
+                bodies = None
+
+            if bodies is not None:
+                return [self._note_from_text(chunk, body) for chunk, body in zip(chunks, bodies)]
+
+        # Single chunk, or the packed response couldn't be used: one request each
+        return list(await asyncio.gather(*(
+            self.generate_note_async(chunk, temperature=temperature, max_tokens=max_tokens)
+            for chunk in chunks
+        )))
+
+    def _create_packed_prompt(self, chunks: List[TextChunk]) -> str:
+        """Create one user message asking for a separate note on each chunk."""
+        parts = [_PACKED_PROMPT_HEADER.format(count=len(chunks))]
+        parts.extend(
+            _PACKED_CHUNK_TEMPLATE.format(
+                id=i,
+                prompt=self._create_note_prompt(chunk.content, chunk.chapter_title)
+            )
+            for i, chunk in enumerate(chunks, 1)
+        )
+        return "\n\n".join(parts)
+
+    @staticmethod
+    def _split_packed_response(response_text: str, count: int) -> Optional[List[str]]:
+        """Split a packed response into one note per chunk, or None if any are missing."""
+        parts = _PACKED_NOTE_RE.split(response_text)
+        # parts = [preamble, id, note, id, note, ...]
+        notes = {int(note_id): body for note_id, body in zip(parts[1::2], parts[2::2])}
+        if sorted(notes) != list(range(1, count + 1)):
+            return None
+        return [notes[i] for i in range(1, count + 1)]
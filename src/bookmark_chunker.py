@@ -3,20 +3,62 @@ Bookmark-based chunking that extracts document structure from PDF bookmarks
 and creates semantically meaningful chunks aligned with chapters/sections.
 """
 
+import os
 import pymupdf
 import re
-from typing import List, Optional, Tuple
+from bisect import bisect_left, bisect_right
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from itertools import repeat
+from typing import Dict, List, Optional, Pattern, Tuple
 from dataclasses import dataclass
 from src.text_chunker import TextChunker
 
 
-@dataclass
+# Compiled once; these run for every bookmark and every searched page
+_SECTION_NUM_RE = re.compile(r'^(\d+(?:\.\d+)*)\s+')
+_LEADING_NUM_RE = re.compile(r'^\d+(?:\.\d+)*\s+')
+
+# A section number at the start of a line: where numbered headings begin
+_HEADING_LINE_RE = re.compile(r'^[^\S\n]*(\d+(?:\.\d+)*)(?=\s)', re.MULTILINE)
+
+# Placed between pages in the full-document text
+_PAGE_SEPARATOR = '\n\f\n'
+
+
+@lru_cache(maxsize=1024)
+def _heading_patterns(normalized_title: str, section_number: Optional[str]) -> Tuple[Pattern, ...]:
+    """
+    Compiled heading patterns for a title, most specific first.
+
+    Words of the title may be separated by any whitespace, so the patterns
+    match raw page text as well as normalized text.
+    """
+    patterns = []
+    title = r'\s+'.join(re.escape(word) for word in normalized_title.split(' '))
+
+    if section_number:
+        # Pattern: "1.1 Introduction", "1.1\tIntroduction" or "1.1Introduction".
+        # \s* also covers the spaced forms, so no separate \s+ pattern is needed
+        escaped_number = re.escape(section_number)
+        patterns.append(f"{escaped_number}\\s*{title}")
+
+    # Also try just the title (for chapters or when number matching fails)
+    patterns.append(title)
+
+    return tuple(re.compile(pattern, re.IGNORECASE) for pattern in patterns)
+
+
+@dataclass(slots=True, frozen=True)
 class StructuredChunk:
     """
     A chunk representing a complete section from the book.
 
     Preserves hierarchical context and page locations for better note organization.
     Compatible with both NoteGenerator and APIBasedNoteGenerator interfaces.
+
+    Immutable and slotted: books produce thousands of these, and nothing changes
+    them after construction.
     """
     # Hierarchical position
     level: int                    # Bookmark level (1=chapter, 2=section, 3=subsection, etc.)
@@ -36,7 +78,8 @@ class StructuredChunk:
     end_page: int                 # PyMuPDF page index (0-based) where section ends
 
     # Metadata
-    token_count: int              # Number of tokens in content
+    token_count: int              # Tokens in content; estimated as len(content) // 4 for
+                                  # unsplit sections short enough to skip the tokenizer
 
     # Fields with defaults (must come after non-default fields in dataclass)
     parent_section_title: Optional[str] = None  # e.g., "Data Science Activities" for subsection "1.5.1"
@@ -73,7 +116,12 @@ class BookmarkChunker:
     eliminating the need for manual index.yaml creation.
     """
 
-    def __init__(self, pdf_path: str, max_chunk_size: int = 2048, overlap_size: int = 200):
+    # Documents with fewer pages than this are extracted in-process; starting
+    # worker processes would cost more than it saves
+    parallel_min_pages = 64
+
+    def __init__(self, pdf_path: str, max_chunk_size: int = 2048, overlap_size: int = 200,
+                 extract_workers: Optional[int] = None):
         """
         Initialize the bookmark-based chunker.
 
@@ -81,12 +129,153 @@ class BookmarkChunker:
             pdf_path: Path to the PDF file
             max_chunk_size: Maximum tokens per chunk (for splitting large sections)
             overlap_size: Token overlap when splitting large sections
+            extract_workers: Worker processes for page text extraction
+                (default: one per CPU)
         """
         self.pdf_path = pdf_path
         self.doc = pymupdf.open(pdf_path)
         self.max_chunk_size = max_chunk_size
         self.overlap_size = overlap_size
+        self.extract_workers = extract_workers
         self.text_chunker = TextChunker(max_chunk_size, overlap_size)
+        # Neighbouring sections search overlapping page windows, so each page's
+        # text is extracted once and reused
+        self._page_text_cache: List[Optional[str]] = [None] * self.doc.page_count
+
+        # Whole-document text and the offset where each page starts in it (plus a
+        # final end offset); built on first heading search. Only pages in
+        # _index_range (0-based, end exclusive) have their text in it
+        self._full_text: Optional[str] = None
+        self._page_offsets: List[int] = []
+        self._index_range: Tuple[int, int] = (0, 0)
+        # Section number -> offsets (ascending) of lines starting with it
+        self._heading_index: Dict[str, List[int]] = {}
+
+    def _page_text(self, page_num: int) -> str:
+        """Return the text of a page (0-based), extracting it on first use."""
+        text = self._page_text_cache[page_num]
+        if text is None:
+            text = self.doc[page_num].get_text("text")
+            self._page_text_cache[page_num] = text
+        return text
+
+    def prefetch_pages(self, start_page: int = 0, end_page: Optional[int] = None) -> None:
+        """
+        Extract the text of a page range (0-based, end exclusive) into the page cache.
+
+        Large ranges are split into one contiguous slice per worker process;
+        each worker opens its own document since PyMuPDF handles can't be shared.
+        """
+        if end_page is None:
+            end_page = self.doc.page_count
+        missing = [i for i in range(start_page, end_page) if self._page_text_cache[i] is None]
+        if not missing:
+            return
+
+        max_workers = min(self.extract_workers or os.cpu_count() or 1, len(missing))
+        if max_workers <= 1 or len(missing) < self.parallel_min_pages:
+            for page_num in missing:
+                self._page_text(page_num)
+            return
+
+        first, last = missing[0], missing[-1] + 1
+        step = -(-(last - first) // max_workers)
+        starts = range(first, last, step)
+        ends = [min(start + step, last) for start in starts]
+
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            for start, texts in zip(starts, executor.map(_extract_page_texts, repeat(self.pdf_path), starts, ends)):
+                self._page_text_cache[start:start + len(texts)] = texts
+
+    def _build_text_index(self, start_page: int = 0, end_page: Optional[int] = None) -> None:
+        """
+        Join page texts into one string and record where each page starts.
+
+        Only pages in the range (0-based, end exclusive) are extracted; the
+        others are left empty. The index is rebuilt over a wider range if a
+        later search needs pages outside it.
+        """
+        if end_page is None:
+            end_page = self.doc.page_count
+        if self._full_text is not None:
+            indexed_start, indexed_end = self._index_range
+            if indexed_start <= start_page and end_page <= indexed_end:
+                return
+            start_page = min(start_page, indexed_start)
+            end_page = max(end_page, indexed_end)
+
+        self.prefetch_pages(start_page, end_page)
+        page_texts = [
+            self._page_text(i) if start_page <= i < end_page else ""
+            for i in range(self.doc.page_count)
+        ]
+
+        offsets = []
+        position = 0
+        for text in page_texts:
+            offsets.append(position)
+            position += len(text) + len(_PAGE_SEPARATOR)
+        # Sentinel: end of the last page
+        offsets.append(max(0, position - len(_PAGE_SEPARATOR)))
+
+        self._full_text = _PAGE_SEPARATOR.join(page_texts)
+        self._page_offsets = offsets
+        self._index_range = (start_page, end_page)
+
+        # One sweep for every numbered line; heading lookups check these first
+        heading_index = {}
+        for match in _HEADING_LINE_RE.finditer(self._full_text):
+            heading_index.setdefault(match.group(1), []).append(match.start(1))
+        self._heading_index = heading_index
+
+    def _page_at(self, position: int) -> int:
+        """Page index (0-based) containing a position in the full-document text."""
+        return bisect_right(self._page_offsets, position) - 1
+
+    def _find_heading_global(
+        self,
+        heading_title: str,
+        section_number: Optional[str],
+        start: int,
+        end: int
+    ) -> Optional[Tuple[int, int]]:
+        """
+        Find a heading in the full-document text between two offsets.
+
+        A numbered heading at the start of a line is looked up in the heading
+        index first. Otherwise the text is searched: the heading on the
+        earliest page wins, and on that page the most specific pattern (number
+        + title before title alone) is used, as if the pages were searched one
+        by one.
+
+        Returns:
+            (start, end) offsets of the heading in the full text, or None
+        """
+        normalized_title = self.normalize_text_for_matching(heading_title)
+        patterns = _heading_patterns(normalized_title, section_number)
+
+        if section_number:
+            candidates = self._heading_index.get(section_number, [])
+            numbered_patterns = patterns[:-1]
+            for i in range(bisect_left(candidates, start), len(candidates)):
+                if candidates[i] >= end:
+                    break
+                for pattern in numbered_patterns:
+                    match = pattern.match(self._full_text, candidates[i], end)
+                    if match:
+                        return match.start(), match.end()
+
+        best = None
+        best_page = None
+
+        for pattern in patterns:
+            match = pattern.search(self._full_text, start, end)
+            if match:
+                page = self._page_at(match.start())
+                if best_page is None or page < best_page:
+                    best, best_page = match, page
+
+        return (best.start(), best.end()) if best else None
 
     def has_bookmarks(self) -> bool:
         """
@@ -134,7 +323,16 @@ class BookmarkChunker:
         start_idx = start_page - 1
         end_idx = end_page - 1
 
-        # Filter to bookmarks that start within or before the range
+        # Bookmarks are normally in page order; then the range is a contiguous
+        # slice found by binary search
+        pages = [page for _, _, page in bookmarks]
+        if all(a <= b for a, b in zip(pages, pages[1:])):
+            lo = bisect_left(pages, start_idx)
+            hi = bisect_right(pages, end_idx, lo)
+            return bookmarks[lo:hi]
+
+        # Out-of-order outline: keep the original scan, which stops at the first
+        # bookmark past the range
         filtered = []
         for level, title, page in bookmarks:
             # Include if bookmark starts within range
@@ -162,7 +360,7 @@ class BookmarkChunker:
             Section number string, or None if no number found
         """
         # Match patterns like "1", "1.5", "1.5.1", "1.5.1.2" at start of title
-        match = re.match(r'^(\d+(?:\.\d+)*)\s+', title)
+        match = _SECTION_NUM_RE.match(title)
         if match:
             return match.group(1)
         return None
@@ -191,7 +389,7 @@ class BookmarkChunker:
                 number = self.parse_section_number(title)
                 if number:
                     # Remove number from title
-                    clean_title = re.sub(r'^\d+(?:\.\d+)*\s+', '', title)
+                    clean_title = _LEADING_NUM_RE.sub('', title)
                     return number, clean_title
                 else:
                     # No number (e.g., "Preface"), use full title
@@ -243,7 +441,7 @@ class BookmarkChunker:
 
             if section_num == parent_section_number:
                 # Found the parent section - extract title without number
-                clean_title = re.sub(r'^\d+(?:\.\d+)*\s+', '', title)
+                clean_title = _LEADING_NUM_RE.sub('', title)
                 return clean_title
 
         return None
@@ -261,9 +459,9 @@ class BookmarkChunker:
         Returns:
             Normalized text with single spaces
         """
-        # Replace all whitespace (spaces, tabs, newlines) with single space
-        normalized = re.sub(r'\s+', ' ', text)
-        return normalized.strip()
+        # Replace all whitespace (spaces, tabs, newlines) with single space;
+        # split() drops leading/trailing whitespace too
+        return ' '.join(text.split())
 
     def find_heading_in_text(self, text: str, heading_title: str, section_number: str = None) -> int:
         """
@@ -287,20 +485,8 @@ class BookmarkChunker:
         normalized_title = self.normalize_text_for_matching(heading_title)
 
         # Try different heading patterns
-        patterns = []
-
-        if section_number:
-            # Pattern: "1.1 Introduction" or "1.1\tIntroduction" etc.
-            # The \s+ allows for any whitespace between number and title
-            escaped_number = re.escape(section_number)
-            patterns.append(f"{escaped_number}\\s+{re.escape(normalized_title)}")
-            patterns.append(f"{escaped_number}\\s*{re.escape(normalized_title)}")
-
-        # Also try just the title (for chapters or when number matching fails)
-        patterns.append(re.escape(normalized_title))
-
-        for pattern in patterns:
-            match = re.search(pattern, normalized_text, re.IGNORECASE)
+        for pattern in _heading_patterns(normalized_title, section_number):
+            match = pattern.search(normalized_text)
             if match:
                 return match.start()
 
@@ -332,99 +518,47 @@ class BookmarkChunker:
         Returns:
             Text content between the two headings
         """
-        content_parts = []
-        found_start = False
-        start_position = 0
-
-        # Search for the start heading and extract until end heading
-        for page_offset in range(max_pages):
-            page_num = start_page + page_offset
-
-            if page_num >= len(self.doc):
-                break
-
-            page = self.doc[page_num]
-            page_text = page.get_text()
-
-            if not page_text.strip():
-                continue
-
-            # Look for start heading on first page
-            if not found_start and page_offset == 0:
-                start_pos = self.find_heading_in_text(
-                    page_text,
-                    start_heading_title,
-                    start_section_number
-                )
-
-                if start_pos >= 0:
-                    found_start = True
-                    # Extract text after the heading on this page
-                    # Skip the heading itself by finding the end of the line
-                    lines = page_text.split('\n')
-                    current_pos = 0
-
-                    for i, line in enumerate(lines):
-                        line_end = current_pos + len(line)
-
-                        if current_pos <= start_pos < line_end:
-                            # Found the line with the heading, start from next line
-                            remaining_text = '\n'.join(lines[i+1:])
-
-                            # Check if end heading is on same page
-                            if end_heading_title:
-                                end_pos = self.find_heading_in_text(
-                                    remaining_text,
-                                    end_heading_title,
-                                    end_section_number
-                                )
-
-                                if end_pos >= 0:
-                                    # End heading found on same page
-                                    content_parts.append(remaining_text[:end_pos])
-                                    found_start = False  # Signal we're done
-                                    break
-
-                            # End heading not on this page, take all remaining text
-                            content_parts.append(remaining_text)
-                            break
-
-                        current_pos = line_end + 1  # +1 for newline
-                else:
-                    # Heading not found on expected page - take the whole page as fallback
-                    # This handles cases where bookmark page is slightly off
-                    found_start = True
-                    content_parts.append(page_text)
-
-            elif found_start:
-                # We're past the start heading, look for end heading
-                if end_heading_title:
-                    end_pos = self.find_heading_in_text(
-                        page_text,
-                        end_heading_title,
-                        end_section_number
-                    )
-
-                    if end_pos >= 0:
-                        # Found end heading - extract text up to it
-                        content_parts.append(page_text[:end_pos])
-                        break
-
-                # End heading not found yet, add entire page
-                content_parts.append(page_text)
-
-            # Stop if we signaled we're done
-            if not found_start and page_offset > 0:
-                break
-
-        # Join and clean the extracted text
-        full_text = ' '.join(content_parts)
+        if start_page >= self.doc.page_count:
+            return ""
+
+        # Pages searched: start_page up to (not including) window_end_page
+        window_end_page = min(start_page + max_pages, self.doc.page_count)
+        self._build_text_index(start_page, max(window_end_page, start_page + 1))
+        window_end = self._page_offsets[window_end_page]
+
+        start_match = self._find_heading_global(
+            start_heading_title,
+            start_section_number,
+            self._page_offsets[start_page],
+            self._page_offsets[start_page + 1]
+        )
+
+        if start_match:
+            # Skip the heading itself: content starts on the line after it
+            line_end = self._full_text.find('\n', start_match[1], window_end)
+            content_start = line_end + 1 if line_end >= 0 else window_end
+            end_search_from = content_start
+        else:
+            # Heading not found on expected page - take the whole page as fallback
+            # This handles cases where bookmark page is slightly off
+            content_start = self._page_offsets[start_page]
+            end_search_from = self._page_offsets[start_page + 1]
+
+        content_end = window_end
+        if end_heading_title and end_search_from < window_end:
+            end_match = self._find_heading_global(
+                end_heading_title,
+                end_section_number,
+                end_search_from,
+                window_end
+            )
+            if end_match:
+                content_end = end_match[0]
 
-        # Basic cleaning - normalize whitespace
-        cleaned = re.sub(r'\n+', ' ', full_text)
-        cleaned = re.sub(r'\s+', ' ', cleaned)
+        content = self._full_text[content_start:content_end]
 
-        return cleaned.strip()
+        # Basic cleaning - normalize whitespace (newlines included) in one pass
+        return ' '.join(content.split())
 
     def extract_text_between_pages(self, start_page: int, end_page: int) -> str:
         """
@@ -442,14 +576,11 @@ class BookmarkChunker:
         text_parts = []
 
         for page_num in range(start_page, min(end_page, len(self.doc))):
-            page = self.doc[page_num]
-            text = page.get_text()
+            text = self._page_text(page_num)
 
             if text.strip():
                 # Basic cleaning - remove excessive whitespace
-                cleaned = re.sub(r'\n+', ' ', text)
-                cleaned = re.sub(r'\s+', ' ', cleaned)
-                text_parts.append(cleaned.strip())
+                text_parts.append(' '.join(text.split()))
 
         return ' '.join(text_parts)
 
@@ -487,42 +618,68 @@ class BookmarkChunker:
             if not bookmarks:
                 return []
 
-        chunks = []
+        # Section numbers, clean titles, chapter context and parent titles for all
+        # bookmarks in one forward pass (same results as get_chapter_context and
+        # get_parent_section_title, without walking back from every bookmark)
+        parsed = []
+        chapter_context = ("", "")
+        section_titles = {}
 
-        for i, (level, title, page) in enumerate(bookmarks):
-            # Parse section number from title
-            section_number = self.parse_section_number(title)
+        for level, title, _ in bookmarks:
+            # One match gives both the number and the title without it
+            match = _SECTION_NUM_RE.match(title)
+            number = match.group(1) if match else None
+            clean = title[match.end():] if match else title
+
+            if level == 1:
+                chapter_context = (number, clean) if number else ("", title)
 
+            parent = self.get_parent_section(number) if number else None
+            parent_title = section_titles.get(parent) if parent else None
+
+            parsed.append((number, clean, chapter_context, parent, parent_title))
+            if number:
+                section_titles[number] = clean
+
+        # Page window each section's text is searched in
+        windows = []
+
+        for i, (level, title, page) in enumerate(bookmarks):
             # Skip non-content bookmarks (like "Contents", "Preface" etc.) unless they have numbers
             # This keeps the output focused on actual book content
-            if section_number is None and level == 1:
+            if parsed[i][0] is None and level == 1:
                 continue
 
-            # Get clean title (without section number)
-            clean_title = re.sub(r'^\d+(?:\.\d+)*\s+', '', title) if section_number else title
+            next_page = bookmarks[i + 1][2] if i + 1 < len(bookmarks) else len(self.doc)
+
+            # Apply end_page limit if specified
+            if end_page is not None:
+                next_page = min(next_page, end_page - 1)  # Convert to 0-based
 
-            # Get chapter context
-            chapter_num, chapter_title = self.get_chapter_context(bookmarks, i)
+            # Search a bit beyond bookmark page
+            windows.append((i, next_page, min(50, next_page - page + 5)))
+
+        # Extract and index only the pages those windows cover, in one batch
+        if windows:
+            self._build_text_index(
+                min(bookmarks[i][2] for i, _, _ in windows),
+                min(max(bookmarks[i][2] + max(max_pages, 1) for i, _, max_pages in windows),
+                    self.doc.page_count)
+            )
 
-            # Get parent section number and title
-            parent = self.get_parent_section(section_number) if section_number else None
-            parent_title = None
-            if parent:
-                parent_title = self.get_parent_section_title(bookmarks, i, parent)
+        # First pass: extract every section's text
+        sections = []
+
+        for i, next_page, max_pages in windows:
+            level, title, page = bookmarks[i]
+            section_number, clean_title, (chapter_num, chapter_title), parent, parent_title = parsed[i]
 
             # Get next section info for boundary detection
             next_section_title = None
             next_section_number = None
-            next_page = len(self.doc)
 
             if i + 1 < len(bookmarks):
-                next_level, next_title, next_page = bookmarks[i + 1]
-                next_section_number = self.parse_section_number(next_title)
-                next_section_title = re.sub(r'^\d+(?:\.\d+)*\s+', '', next_title) if next_section_number else next_title
-
-            # Apply end_page limit if specified
-            if end_page is not None:
-                next_page = min(next_page, end_page - 1)  # Convert to 0-based
+                next_section_number, next_section_title = parsed[i + 1][:2]
 
             # Extract text content using heading-based extraction
             # This is more accurate than page-based extraction
@@ -532,14 +689,34 @@ class BookmarkChunker:
                 start_section_number=section_number,
                 end_heading_title=next_section_title,
                 end_section_number=next_section_number,
-                max_pages=min(50, next_page - page + 5)  # Search a bit beyond bookmark page
+                max_pages=max_pages
             )
 
             if not content.strip():
                 continue
 
-            # Count tokens
-            token_count = self.text_chunker.count_tokens(content)
+            sections.append((level, page, next_page, section_number, clean_title,
+                             chapter_num, chapter_title, parent, parent_title, content))
+
+        # Count tokens, all at once. Every BPE token covers at least one UTF-8
+        # byte, so a section with no more bytes than max_chunk_size can't need
+        # splitting and the tokenizer is skipped (token_count is then an estimate)
+        token_counts = [len(section[-1]) // 4 for section in sections]
+        to_count = [
+            i for i, section in enumerate(sections)
+            if len(section[-1].encode('utf-8')) > self.max_chunk_size
+        ]
+        if to_count:
+            counted = self.text_chunker.count_tokens_batch([sections[i][-1] for i in to_count])
+            for i, count in zip(to_count, counted):
+                token_counts[i] = count
+
+        # Second pass: build the chunks
+        chunks = []
+
+        for section, token_count in zip(sections, token_counts):
+            (level, page, next_page, section_number, clean_title,
+             chapter_num, chapter_title, parent, parent_title, content) = section
 
             # If content exceeds max size, split it using TextChunker
             if token_count > self.max_chunk_size:
@@ -603,3 +780,9 @@ class BookmarkChunker:
     def __exit__(self, exc_type, exc_val, exc_tb):
         """Context manager exit - ensures PDF is closed."""
         self.close()
+
+
+def _extract_page_texts(pdf_path: str, start_page: int, end_page: int) -> List[str]:
+    """Worker for BookmarkChunker.prefetch_pages: text of each page in a range."""
+    with pymupdf.open(pdf_path) as doc:
+        return [doc[i].get_text("text") for i in range(start_page, end_page)]
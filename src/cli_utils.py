@@ -0,0 +1,22 @@
+"""
+Helpers for parsing command-line arguments.
+"""
+
+def _parse_page_part(part):
+    """Parse a single '5' or '9-12' page spec into an inclusive (start, end) pair."""
+    part = part.strip()
+    if '-' in part:
+        start, end = map(int, part.split('-'))
+        return start, end
+    page = int(part)
+    return page, page
+
+
+def parse_page_bounds(pages_str):
+    """Return the first and last page of a specification like '5,7,9-12' without expanding it."""
+    ranges = [r for r in map(_parse_page_part, pages_str.split(',')) if r[0] <= r[1]]
+    if not ranges:
+        raise ValueError(f"No pages in range: {pages_str}")
+
+    return min(start for start, _ in ranges), max(end for _, end in ranges)
+
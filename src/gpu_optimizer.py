@@ -1,15 +1,110 @@
-import torch
-import subprocess
-import re
-from typing import Dict, Tuple
+from functools import lru_cache
+from typing import Dict, Optional, Tuple
+
+
+# Settings per VRAM tier, largest first: the first tier the GPU reaches applies
+_TIER_TABLE = [
+    (16, {  # RTX 5070 Ti, 4080, 4090
+        "recommended_model": "microsoft/Phi-3-mini-4k-instruct",  # High quality, efficient
+        "fallback_models": ["google/flan-t5-large", "microsoft/DialoGPT-large"],
+        "chunk_size": 3072,
+        "batch_size": 4,
+        "use_fp16": True,
+        "max_new_tokens": 512,
+        "performance_tier": "High-End"
+    }),
+    (12, {  # RTX 4070, 3080 Ti
+        "recommended_model": "google/flan-t5-large",
+        "fallback_models": ["google/flan-t5-base", "microsoft/DialoGPT-medium"],
+        "chunk_size": 2048,
+        "batch_size": 2,
+        "use_fp16": True,
+        "max_new_tokens": 400,
+        "performance_tier": "High"
+    }),
+    (8, {  # RTX 4060 Ti, 3070
+        "recommended_model": "google/flan-t5-base",
+        "fallback_models": ["google/flan-t5-small", "microsoft/DialoGPT-medium"],
+        "chunk_size": 1536,
+        "batch_size": 2,
+        "use_fp16": True,
+        "max_new_tokens": 350,
+        "performance_tier": "Medium-High"
+    }),
+    (6, {  # RTX 3060, 4060
+        "recommended_model": "google/flan-t5-base",
+        "fallback_models": ["google/flan-t5-small", "microsoft/DialoGPT-small"],
+        "chunk_size": 1024,
+        "batch_size": 1,
+        "use_fp16": True,
+        "max_new_tokens": 300,
+        "performance_tier": "Medium"
+    }),
+    (0, {  # Less than 6GB or CPU
+        "recommended_model": "google/flan-t5-small",
+        "fallback_models": ["microsoft/DialoGPT-small", "distilgpt2"],
+        "chunk_size": 512,
+        "batch_size": 1,
+        "use_fp16": False,
+        "max_new_tokens": 256,
+        "performance_tier": "Basic"
+    }),
+]
+
+
+@lru_cache(maxsize=None)
+def _query_gpu() -> Optional[Tuple[str, int]]:
+    """
+    Return (name, VRAM in GB) of the first CUDA device, or None without CUDA.
+
+    Cached, since the hardware doesn't change while the program runs.
+    """
+    # torch is slow to import, so it's only loaded once detection runs
+    import torch
+
+    if not torch.cuda.is_available():
+        return None
+
+    try:
+        # Exact total memory straight from the driver, no process spawn
+        props = torch.cuda.get_device_properties(0)
+        if props.name:
+            return props.name, props.total_memory // (1024**3)
+    except RuntimeError:
+        pass
+
+    import subprocess
+
+    try:
+        # Fallback: ask nvidia-smi
+        result = subprocess.run(['nvidia-smi', '--query-gpu=name,memory.total', '--format=csv,noheader,nounits'],
+                              capture_output=True, text=True, timeout=5)
+
+        if result.returncode == 0:
+            lines = result.stdout.strip().split('\n')
+            for line in lines:
+                if ',' in line:
+                    name, memory = line.split(',', 1)
+                    return name.strip(), int(memory.strip()) // 1024  # Convert MB to GB
+
+    except (subprocess.TimeoutExpired, FileNotFoundError, ValueError):
+        pass
+
+    return None
 
 
 class GPUOptimizer:
     def __init__(self):
         self.gpu_info = self._detect_gpu()
 
-    def _detect_gpu(self) -> Dict:
-        """Detect GPU capabilities and return optimization settings"""
+    @classmethod
+    def _detect_gpu(cls) -> Dict:
+        """
+        Detect GPU capabilities and return optimization settings.
+
+        The hardware query itself is cached by _query_gpu, so later instances
+        only rebuild this dict.
+        """
         gpu_info = {
             "has_gpu": False,
             "gpu_name": "CPU",
@@ -20,90 +115,26 @@ class GPUOptimizer:
             "use_fp16": False
         }
 
-        if not torch.cuda.is_available():
+        detected = _query_gpu()
+        if not detected:
             return gpu_info
 
-        try:
-            # Get GPU info from nvidia-smi
-            result = subprocess.run(['nvidia-smi', '--query-gpu=name,memory.total', '--format=csv,noheader,nounits'],
-                                  capture_output=True, text=True, timeout=5)
-
-            if result.returncode == 0:
-                lines = result.stdout.strip().split('\n')
-                for line in lines:
-                    if ',' in line:
-                        name, memory = line.split(',', 1)
-                        gpu_info["has_gpu"] = True
-                        gpu_info["gpu_name"] = name.strip()
-                        gpu_info["vram_gb"] = int(memory.strip()) // 1024  # Convert MB to GB
-                        break
-
-        except (subprocess.TimeoutExpired, FileNotFoundError, ValueError):
-            # Fallback to torch detection
-            if torch.cuda.is_available():
-                gpu_info["has_gpu"] = True
-                gpu_info["gpu_name"] = torch.cuda.get_device_name(0)
-                # Estimate VRAM (torch doesn't give exact total)
-                gpu_info["vram_gb"] = torch.cuda.get_device_properties(0).total_memory // (1024**3)
+        gpu_info["has_gpu"] = True
+        gpu_info["gpu_name"], gpu_info["vram_gb"] = detected
 
         # Optimize settings based on VRAM
-        self._optimize_settings(gpu_info)
+        cls._optimize_settings(gpu_info)
         return gpu_info
 
-    def _optimize_settings(self, gpu_info: Dict) -> None:
+    @staticmethod
+    def _optimize_settings(gpu_info: Dict) -> None:
         """Set optimal parameters based on GPU capabilities"""
         vram = gpu_info["vram_gb"]
 
-        if vram >= 16:  # RTX 5070 Ti, 4080, 4090
-            gpu_info.update({
-                "recommended_model": "microsoft/Phi-3-mini-4k-instruct",  # High quality, efficient
-                "fallback_models": ["google/flan-t5-large", "microsoft/DialoGPT-large"],
-                "chunk_size": 3072,
-                "batch_size": 4,
-                "use_fp16": True,
-                "max_new_tokens": 512,
-                "performance_tier": "High-End"
-            })
-        elif vram >= 12:  # RTX 4070, 3080 Ti
-            gpu_info.update({
-                "recommended_model": "google/flan-t5-large",
-                "fallback_models": ["google/flan-t5-base", "microsoft/DialoGPT-medium"],
-                "chunk_size": 2048,
-                "batch_size": 2,
-                "use_fp16": True,
-                "max_new_tokens": 400,
-                "performance_tier": "High"
-            })
-        elif vram >= 8:   # RTX 4060 Ti, 3070
-            gpu_info.update({
-                "recommended_model": "google/flan-t5-base",
-                "fallback_models": ["google/flan-t5-small", "microsoft/DialoGPT-medium"],
-                "chunk_size": 1536,
-                "batch_size": 2,
-                "use_fp16": True,
-                "max_new_tokens": 350,
-                "performance_tier": "Medium-High"
-            })
-        elif vram >= 6:   # RTX 3060, 4060
-            gpu_info.update({
-                "recommended_model": "google/flan-t5-base",
-                "fallback_models": ["google/flan-t5-small", "microsoft/DialoGPT-small"],
-                "chunk_size": 1024,
-                "batch_size": 1,
-                "use_fp16": True,
-                "max_new_tokens": 300,
-                "performance_tier": "Medium"
-            })
-        else:  # Less than 6GB or CPU
-            gpu_info.update({
-                "recommended_model": "google/flan-t5-small",
-                "fallback_models": ["microsoft/DialoGPT-small", "distilgpt2"],
-                "chunk_size": 512,
-                "batch_size": 1,
-                "use_fp16": False,
-                "max_new_tokens": 256,
-                "performance_tier": "Basic"
-            })
+        for min_vram, settings in _TIER_TABLE:
+            if vram >= min_vram:
+                gpu_info.update(settings)
+                return
 
     def get_optimized_settings(self) -> Dict:
         """Return optimized settings for current GPU"""
@@ -1,24 +1,51 @@
 import os
+import re
 import pymupdf
+from collections import defaultdict
 from datetime import datetime
-from typing import List, Dict, Union
+from functools import lru_cache
+from typing import List, Dict, Tuple, Union
 from .note_generator import GeneratedNote
 
+# Classifies a stripped note line, alternatives tried in order: an existing
+# bullet, a short "label: text" line, or a line opening with a keyword
+_NOTE_LINE_RE = re.compile(
+    r'(?P<bullet>[•\-*])|(?P<pair>(?P<label>[^:]{0,49}):(?P<text>.*))|(?P<keyword>key|important|note|concept|definition)',
+    re.IGNORECASE | re.DOTALL
+)
+
+# Bullet characters notes use for key points
+_BULLET_PREFIXES = ('•', '-', '*')
+
+# Words marking a line as a key concept, anywhere in the line
+_CONCEPT_RE = re.compile(r'concept|definition|important|key', re.IGNORECASE)
+
+
+@lru_cache(maxsize=64)
+def _base_filename(path: str) -> str:
+    """File name of path without directory or extension, e.g. "book" for "dir/book.pdf"."""
+    return os.path.splitext(os.path.basename(path))[0]
+
 
 class MarkdownFormatter:
     def __init__(self, output_dir: str = "output"):
         self.output_dir = output_dir
         os.makedirs(output_dir, exist_ok=True)
+        # Metadata per (path, modification time), so an edited PDF is re-read
+        self._meta_cache: Dict[Tuple[str, float], Dict[str, str]] = {}
 
     def format_notes_to_markdown(self, notes: List[GeneratedNote], pdf_filename: str, model_name: str = "unknown") -> str:
+        return "\n".join(self.format_notes_to_markdown_lines(notes, pdf_filename, model_name))
+
+    def format_notes_to_markdown_lines(self, notes: List[GeneratedNote], pdf_filename: str, model_name: str = "unknown") -> List[str]:
+        """Like format_notes_to_markdown, but returns the newline-separated parts for save_markdown_file."""
         timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        base_filename = os.path.splitext(os.path.basename(pdf_filename))[0]
+        base_filename = _base_filename(pdf_filename)
 
-        markdown_content = []
-        markdown_content.append(f"# Notes: {base_filename}")
-        markdown_content.append(f"*Generated on: {timestamp}*")
-        markdown_content.append(f"*Model: {model_name}*")
-        markdown_content.append("")
+        # Each block is one multi-line string, so a block costs one append;
+        # a trailing "\n" stands for the blank line after it
+        markdown_content = [f"# Notes: {base_filename}\n*Generated on: {timestamp}*\n*Model: {model_name}*\n"]
+        add_line = markdown_content.append
 
         current_chapter = ""
         note_counter = 1
@@ -26,26 +53,19 @@ class MarkdownFormatter:
         for note in notes:
             if note.chapter_title and note.chapter_title != current_chapter:
                 current_chapter = note.chapter_title
-                markdown_content.append(f"## {current_chapter}")
-                markdown_content.append("")
+                add_line(f"## {current_chapter}\n")
 
             if note.content.strip():
                 page_info = f"Pages {min(note.source_pages)}-{max(note.source_pages)}" if len(note.source_pages) > 1 else f"Page {note.source_pages[0]}" if note.source_pages else "Unknown page"
 
-                markdown_content.append(f"### Note {note_counter} ({page_info})")
-                markdown_content.append("")
-
-                formatted_content = self._format_note_content(note.content)
-                markdown_content.append(formatted_content)
-                markdown_content.append("")
-                markdown_content.append("---")
-                markdown_content.append("")
+                add_line(f"### Note {note_counter} ({page_info})\n\n{self._format_note_content(note.content)}\n\n---\n")
 
                 note_counter += 1
 
-        return "\n".join(markdown_content)
+        return markdown_content
 
-    def _format_note_content(self, content: str) -> str:
+    @staticmethod
+    def _format_note_content(content: str) -> str:
         lines = content.split('\n')
         formatted_lines = []
 
@@ -54,98 +74,112 @@ class MarkdownFormatter:
             if not line:
                 continue
 
-            if line.startswith('•') or line.startswith('-') or line.startswith('*'):
+            match = _NOTE_LINE_RE.match(line)
+            kind = match.lastgroup if match else None
+
+            if kind == 'bullet':
                 formatted_lines.append(line)
-            elif ':' in line and len(line.split(':')[0]) < 50:
-                parts = line.split(':', 1)
-                if len(parts) == 2:
-                    formatted_lines.append(f"**{parts[0].strip()}:** {parts[1].strip()}")
-                else:
-                    formatted_lines.append(f"• {line}")
-            elif line.lower().startswith(('key', 'important', 'note', 'concept', 'definition')):
+            elif kind == 'pair':
+                formatted_lines.append(f"**{match['label'].strip()}:** {match['text'].strip()}")
+            elif kind == 'keyword':
                 formatted_lines.append(f"**{line}**")
             else:
                 formatted_lines.append(f"• {line}")
 
         return "\n".join(formatted_lines)
 
-    def save_markdown_file(self, markdown_content: str, pdf_filename: str) -> str:
-        base_filename = os.path.splitext(os.path.basename(pdf_filename))[0]
+    def save_markdown_file(self, markdown_content: Union[str, List[str]], pdf_filename: str) -> str:
+        base_filename = _base_filename(pdf_filename)
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         output_filename = f"{base_filename}_notes_{timestamp}.md"
         output_path = os.path.join(self.output_dir, output_filename)
 
-        with open(output_path, 'w', encoding='utf-8') as f:
-            f.write(markdown_content)
+        # A 1 MiB buffer holds a whole notes file, so it goes out in one write
+        with open(output_path, 'w', encoding='utf-8', buffering=1024 * 1024) as f:
+            if isinstance(markdown_content, str):
+                f.write(markdown_content)
+            else:
+                # Lines go straight into the buffer; the document is never one big string
+                write = f.write
+                lines = iter(markdown_content)
+                write(next(lines, ""))
+                for line in lines:
+                    write("\n")
+                    write(line)
 
         return output_path
 
     def create_summary_section(self, notes: List[GeneratedNote], pdf_filename: str) -> str:
-        base_filename = os.path.splitext(os.path.basename(pdf_filename))[0]
+        key_points, _ = self._collect_highlights(notes)
+        return self._render_summary(key_points, pdf_filename)
 
-        summary_lines = []
-        summary_lines.append(f"# Summary: {base_filename}")
-        summary_lines.append("")
+    def create_obsidian_compatible_note(self, notes: List[GeneratedNote], pdf_filename: str) -> str:
+        _, concepts = self._collect_highlights(notes)
+        return self._render_obsidian(notes, concepts, pdf_filename)
 
-        chapters = {}
-        for note in notes:
-            chapter = note.chapter_title or "General"
-            if chapter not in chapters:
-                chapters[chapter] = []
-            chapters[chapter].append(note.content)
+    def build_summary_and_obsidian(self, notes: List[GeneratedNote], pdf_filename: str) -> Tuple[str, str]:
+        """
+        Build the summary and the Obsidian note from one pass over the notes.
 
-        for chapter, chapter_notes in chapters.items():
-            summary_lines.append(f"## {chapter}")
-            summary_lines.append("")
+        Args:
+            notes: Generated notes
+            pdf_filename: Path to the source PDF
 
-            key_points = []
-            for note_content in chapter_notes:
-                lines = note_content.split('\n')
-                for line in lines:
-                    line = line.strip()
-                    if (line and
-                        (line.startswith('•') or line.startswith('-') or line.startswith('*')) and
-                        len(line) > 20):
-                        key_points.append(line)
+        Returns:
+            (summary markdown, Obsidian markdown)
+        """
+        key_points, concepts = self._collect_highlights(notes)
+        return (
+            self._render_summary(key_points, pdf_filename),
+            self._render_obsidian(notes, concepts, pdf_filename)
+        )
+
+    @staticmethod
+    def _collect_highlights(notes: List[GeneratedNote]) -> Tuple[Dict[str, List[str]], List[str]]:
+        # Up to 5 key points per chapter for the summary, and up to 10
+        # key-concept lines overall for the Obsidian note
+        key_points = defaultdict(list)
+        concepts = []
+
+        for note in notes:
+            chapter_points = key_points[note.chapter_title or "General"]
+            for line in note.content.split('\n'):
+                line = line.strip()
+                if len(line) > 20 and len(chapter_points) < 5 and line.startswith(_BULLET_PREFIXES):
+                    chapter_points.append(line)
+                if len(line) > 15 and len(concepts) < 10 and _CONCEPT_RE.search(line):
+                    concepts.append(line)
 
-            for point in key_points[:5]:
-                summary_lines.append(point)
+        return key_points, concepts
 
+    def _render_summary(self, key_points: Dict[str, List[str]], pdf_filename: str) -> str:
+        summary_lines = [f"# Summary: {_base_filename(pdf_filename)}", ""]
+
+        for chapter, chapter_points in key_points.items():
+            summary_lines.extend((f"## {chapter}", ""))
+            summary_lines.extend(chapter_points)
             summary_lines.append("")
 
         return "\n".join(summary_lines)
 
-    def create_obsidian_compatible_note(self, notes: List[GeneratedNote], pdf_filename: str) -> str:
-        base_filename = os.path.splitext(os.path.basename(pdf_filename))[0]
+    def _render_obsidian(self, notes: List[GeneratedNote], concepts: List[str], pdf_filename: str) -> str:
+        base_filename = _base_filename(pdf_filename)
         timestamp = datetime.now().strftime("%Y-%m-%d")
 
-        obsidian_content = []
-        obsidian_content.append(f"# {base_filename}")
-        obsidian_content.append("")
-        obsidian_content.append(f"**Source:** [[{base_filename}.pdf]]")
-        obsidian_content.append(f"**Date:** {timestamp}")
-        obsidian_content.append(f"**Tags:** #technical-book #programming #notes")
-        obsidian_content.append("")
-
-        obsidian_content.append("## Key Concepts")
-        obsidian_content.append("")
-
-        all_concepts = []
-        for note in notes:
-            lines = note.content.split('\n')
-            for line in lines:
-                line = line.strip()
-                if (line and
-                    any(keyword in line.lower() for keyword in ['concept', 'definition', 'important', 'key']) and
-                    len(line) > 15):
-                    all_concepts.append(line)
-
-        for concept in all_concepts[:10]:
-            obsidian_content.append(f"- {concept}")
-
-        obsidian_content.append("")
-        obsidian_content.append("## Detailed Notes")
-        obsidian_content.append("")
+        obsidian_content = [
+            f"# {base_filename}",
+            "",
+            f"**Source:** [[{base_filename}.pdf]]",
+            f"**Date:** {timestamp}",
+            f"**Tags:** #technical-book #programming #notes",
+            "",
+            "## Key Concepts",
+            "",
+        ]
+        add_lines = obsidian_content.extend
+
+        add_lines(f"- {concept}" for concept in concepts)
+        add_lines(("", "## Detailed Notes", ""))
 
         for i, note in enumerate(notes, 1):
             if note.content.strip():
@@ -153,9 +187,7 @@ class MarkdownFormatter:
                 obsidian_content.append(f"### {page_ref}")
                 if note.chapter_title:
                     obsidian_content.append(f"*Chapter: {note.chapter_title}*")
-                obsidian_content.append("")
-                obsidian_content.append(self._format_note_content(note.content))
-                obsidian_content.append("")
+                add_lines(("", self._format_note_content(note.content), ""))
 
         return "\n".join(obsidian_content)
 
@@ -169,13 +201,22 @@ class MarkdownFormatter:
         Returns:
             Dictionary with title, author, subject, etc.
         """
+        try:
+            cache_key = (pdf_path, os.stat(pdf_path).st_mtime)
+        except OSError:
+            cache_key = None
+
+        if cache_key in self._meta_cache:
+            # Copied so callers can't change the cached entry
+            return dict(self._meta_cache[cache_key])
+
         try:
             doc = pymupdf.open(pdf_path)
             metadata = doc.metadata
 
             # Clean up metadata values (remove None, empty strings)
             cleaned = {
-                'title': metadata.get('title', '').strip() or os.path.splitext(os.path.basename(pdf_path))[0],
+                'title': metadata.get('title', '').strip() or _base_filename(pdf_path),
                 'author': metadata.get('author', '').strip() or 'Unknown',
                 'subject': metadata.get('subject', '').strip() or '',
                 'keywords': metadata.get('keywords', '').strip() or '',
@@ -184,11 +225,13 @@ class MarkdownFormatter:
             }
 
             doc.close()
-            return cleaned
+            if cache_key is not None:
+                self._meta_cache[cache_key] = cleaned
+            return dict(cleaned)
         except Exception:
             # Fallback if metadata extraction fails
             return {
-                'title': os.path.splitext(os.path.basename(pdf_path))[0],
+                'title': _base_filename(pdf_path),
                 'author': 'Unknown',
                 'subject': '',
                 'keywords': '',
@@ -216,75 +259,86 @@ class MarkdownFormatter:
         Returns:
             Formatted markdown string
         """
+        return "\n".join(self.format_structured_notes_to_markdown_lines(notes, pdf_path, model_name))
+
+    def format_structured_notes_to_markdown_lines(
+        self,
+        notes: List[tuple],
+        pdf_path: str,
+        model_name: str = "unknown"
+    ) -> List[str]:
+        """
+        Like format_structured_notes_to_markdown, but returns the parts that
+        are joined with newlines to form the document.
+
+        Passing the parts to save_markdown_file writes them without first
+        joining the whole document into one string.
+        """
         metadata = self.extract_pdf_metadata(pdf_path)
         timestamp = datetime.now().strftime("%Y-%m-%d")
 
+        # Lines are added a group at a time, saving a call per line on long books
         markdown_lines = []
+        add_lines = markdown_lines.extend
 
         # YAML frontmatter with metadata
-        markdown_lines.append("---")
-        markdown_lines.append(f"title: {metadata['title']}")
+        add_lines(("---", f"title: {metadata['title']}"))
         if metadata['author'] and metadata['author'] != 'Unknown':
             # Handle multiple authors (split by semicolon or comma)
-            authors = [a.strip() for a in metadata['author'].replace(';', ',').split(',')]
+            authors = (a.strip() for a in metadata['author'].replace(';', ',').split(','))
             markdown_lines.append("authors:")
-            for author in authors:
-                if author:
-                    markdown_lines.append(f"  - {author}")
+            add_lines(f"  - {author}" for author in authors if author)
         else:
             markdown_lines.append("authors: []")
 
         if metadata['subject']:
             markdown_lines.append(f"subject: {metadata['subject']}")
-        markdown_lines.append(f"generated: {timestamp}")
-        markdown_lines.append(f"model: {model_name}")
-        markdown_lines.append("---")
-        markdown_lines.append("")
+        add_lines((f"generated: {timestamp}", f"model: {model_name}", "---", ""))
 
         # Track current chapter/section to avoid repeating headers
         current_chapter = None
         current_section = None
 
+        # Each header or note block is one multi-line string, so a block costs
+        # one append; a trailing "\n" stands for the blank line after it
+        add_line = markdown_lines.append
+
         for chunk, note in notes:
             # Determine markdown heading level based on bookmark level
             # Level 1 (chapter) -> # (h1)
             # Level 2 (section) -> ## (h2)
             # Level 3 (subsection) -> ### (h3)
             # Level 4 (sub-subsection) -> #### (h4)
-            heading_prefix = '#' * chunk.level
+            level = chunk.level
+            heading_prefix = '#' * level
 
             # Create section identifier
-            section_id = f"{chunk.number} {chunk.title}" if chunk.number else chunk.title
+            number = chunk.number
+            section_id = f"{number} {chunk.title}" if number else chunk.title
+
+            # Every header inserted for this chunk points at its first page (0-based)
+            page_line = f"> p. {chunk.start_page}"
+            chapter_number = chunk.chapter_number
 
             # Skip duplicate headers (important when sections are split)
             # We track chapter and section separately to avoid re-printing headers
-            if chunk.level == 1:
+            if level == 1:
                 if current_chapter != section_id:
-                    markdown_lines.append(f"{heading_prefix} {section_id}")
-                    markdown_lines.append("")
-                    markdown_lines.append(f"> p. {chunk.start_page}")  # 0-based page number
-                    markdown_lines.append("")
+                    add_line(f"{heading_prefix} {section_id}\n\n{page_line}\n")
                     current_chapter = section_id
                     current_section = None  # Reset section when new chapter
-            elif chunk.level == 2:
+            elif level == 2:
                 # Check if we need to insert missing chapter header
                 # This happens when page filtering skips the chapter but includes sections
-                chapter_id = f"{chunk.chapter_number} {chunk.chapter_title}" if chunk.chapter_number else chunk.chapter_title
-                if current_chapter != chapter_id and chunk.chapter_number:
+                chapter_id = f"{chapter_number} {chunk.chapter_title}" if chapter_number else chunk.chapter_title
+                if current_chapter != chapter_id and chapter_number:
                     # Insert missing chapter header (without notes, just structure)
-                    markdown_lines.append(f"# {chapter_id}")
-                    markdown_lines.append("")
-                    markdown_lines.append(f"> p. {chunk.start_page}")  # Best guess - same page as first section
-                    markdown_lines.append("")
-                    markdown_lines.append("*[Chapter header - no separate notes generated]*")
-                    markdown_lines.append("")
+                    # Page is a best guess - same page as first section
+                    add_line(f"# {chapter_id}\n\n{page_line}\n\n*[Chapter header - no separate notes generated]*\n")
                     current_chapter = chapter_id
 
                 if current_section != section_id:
-                    markdown_lines.append(f"{heading_prefix} {section_id}")
-                    markdown_lines.append("")
-                    markdown_lines.append(f"> p. {chunk.start_page}")  # 0-based page number
-                    markdown_lines.append("")
+                    add_line(f"{heading_prefix} {section_id}\n\n{page_line}\n")
                     current_section = section_id
             else:
                 # For level 3+ (subsections), check if we need parent section header
@@ -296,41 +350,25 @@ class MarkdownFormatter:
                     # (i.e., we haven't seen this parent section yet)
                     if current_section != parent_section_id:
                         # Also check if we need chapter header first
-                        chapter_id = f"{chunk.chapter_number} {chunk.chapter_title}" if chunk.chapter_number else chunk.chapter_title
-                        if current_chapter != chapter_id and chunk.chapter_number:
+                        chapter_id = f"{chapter_number} {chunk.chapter_title}" if chapter_number else chunk.chapter_title
+                        if current_chapter != chapter_id and chapter_number:
                             # Insert missing chapter header
-                            markdown_lines.append(f"# {chapter_id}")
-                            markdown_lines.append("")
-                            markdown_lines.append(f"> p. {chunk.start_page}")
-                            markdown_lines.append("")
-                            markdown_lines.append("*[Chapter header - no separate notes generated]*")
-                            markdown_lines.append("")
+                            add_line(f"# {chapter_id}\n\n{page_line}\n\n*[Chapter header - no separate notes generated]*\n")
                             current_chapter = chapter_id
 
                         # Insert the parent section header
-                        markdown_lines.append(f"## {parent_section_id}")
-                        markdown_lines.append("")
-                        markdown_lines.append(f"> p. {chunk.start_page}")
-                        markdown_lines.append("")
-                        markdown_lines.append("*[Section header - content starts with subsections below]*")
-                        markdown_lines.append("")
+                        add_line(f"## {parent_section_id}\n\n{page_line}\n\n*[Section header - content starts with subsections below]*\n")
                         current_section = parent_section_id
 
                 # Always print subsection headers (level 3+)
-                markdown_lines.append(f"{heading_prefix} {section_id}")
-                markdown_lines.append("")
-                markdown_lines.append(f"> p. {chunk.start_page}")  # 0-based page number
-                markdown_lines.append("")
+                add_line(f"{heading_prefix} {section_id}\n\n{page_line}\n")
 
             # Add note content
             if note and note.content.strip():
-                formatted_content = self._format_note_content(note.content)
-                markdown_lines.append(formatted_content)
-                markdown_lines.append("")
+                add_line(f"{self._format_note_content(note.content)}\n")
 
                 # If this is a split chunk, indicate it's a continuation
                 if chunk.is_split and chunk.split_index < chunk.total_splits - 1:
-                    markdown_lines.append(f"*[Continued in part {chunk.split_index + 2}/{chunk.total_splits}...]*")
-                    markdown_lines.append("")
+                    add_line(f"*[Continued in part {chunk.split_index + 2}/{chunk.total_splits}...]*\n")
 
-        return "\n".join(markdown_lines)
\ No newline at end of file
+        return markdown_lines
\ No newline at end of file
@@ -0,0 +1,256 @@
+"""
+Persistent cache of generated notes keyed by chunk content and model.
+
+Re-running the same PDF with unchanged settings returns cached notes instead of
+calling the language model again; only new or changed chunks are generated.
+
+Notes depend only on the chunk and generation settings, never on who asked for
+them, so one cache directory can be shared by several runs or users.
+"""
+
+import asyncio
+import dataclasses
+import hashlib
+import inspect
+import json
+import os
+import sqlite3
+import threading
+import unicodedata
+from typing import List, Optional
+
+# Batch arguments that only change how requests are scheduled, not the notes
+_SCHEDULING_ARGS = frozenset({'batch_size', 'concurrency', 'pack_max_chars'})
+
+
+class NoteCache:
+    """
+    Content-addressed store mapping (model, prompt version, chunk) to a note.
+
+    Keys are BLAKE2b digests, so any change to the chunk text, chapter title,
+    model, prompt version or generation settings produces a miss. Text is
+    NFC-normalized first, so equivalent Unicode spellings share an entry.
+    """
+
+    def __init__(self, cache_dir: str = ".notecache"):
+        """
+        Open (or create) the cache database.
+
+        Args:
+            cache_dir: Directory holding the SQLite cache file
+        """
+        os.makedirs(cache_dir, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(
+            os.path.join(cache_dir, "notes.db"),
+            check_same_thread=False,
+            timeout=30
+        )
+        # WAL lets other processes read while one writes, for shared caches
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS notes (key TEXT PRIMARY KEY, note BLOB NOT NULL)"
+        )
+        self._conn.commit()
+
+    @staticmethod
+    def make_key(chunk, model_name: str, prompt_version: str = "", **settings) -> str:
+        """
+        Build the cache key for a chunk generated by the given model.
+
+        Args:
+            chunk: Chunk the note is generated from
+            model_name: Model that generates the note
+            prompt_version: Version of the prompt template
+            **settings: Generation settings that change the output (e.g.
+                temperature, max_tokens)
+        """
+        content = chunk.content
+        prefix_len = getattr(chunk, 'context_prefix_len', 0)
+        # Normalize context and new text separately so the split point survives
+        context = unicodedata.normalize('NFC', content[:prefix_len])
+        text = unicodedata.normalize('NFC', content[prefix_len:])
+
+        digest = hashlib.blake2b(digest_size=32)
+        for part in (
+            model_name,
+            prompt_version,
+            repr(sorted(settings.items())),
+            unicodedata.normalize('NFC', chunk.chapter_title),
+            context,
+            text,
+        ):
+            digest.update(part.encode('utf-8'))
+            digest.update(b'\0')
+        return digest.hexdigest()
+
+    def get(self, key: str, note_type):
+        """
+        Return the cached note for key, or None on a miss.
+
+        Args:
+            key: Cache key from make_key
+            note_type: GeneratedNote class to rebuild the note as
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT note FROM notes WHERE key = ?", (key,)
+            ).fetchone()
+        if row is None:
+            return None
+
+        try:
+            return note_type(**json.loads(row[0]))
+        except (ValueError, TypeError):
+            # Entries from older versions (or not notes at all) count as misses
+            return None
+
+    def set(self, key: str, note) -> None:
+        """Store a note under key."""
+        # Plain JSON, never pickle: the cache may be shared, and loading a
+        # pickle would run whatever code another writer put in it
+        blob = json.dumps(dataclasses.asdict(note))
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO notes (key, note) VALUES (?, ?)", (key, blob)
+            )
+            self._conn.commit()
+
+    def close(self):
+        """Close the cache database."""
+        with self._lock:
+            self._conn.close()
+
+
+class CachedNoteGenerator:
+    """
+    Wraps a note generator so notes are served from a NoteCache when possible.
+
+    Exposes the same generation methods as NoteGenerator and
+    APIBasedNoteGenerator, so callers don't need to know caching is enabled.
+    Fallback notes (produced when generation fails) are never cached.
+    """
+
+    def __init__(self, generator, cache: NoteCache):
+        """
+        Args:
+            generator: NoteGenerator or APIBasedNoteGenerator to wrap
+            cache: NoteCache to read from and write to
+        """
+        self.generator = generator
+        self.cache = cache
+        # Cached notes are rebuilt as the wrapped generator's own GeneratedNote
+        self._note_type = getattr(inspect.getmodule(generator), 'GeneratedNote', None)
+        if self._note_type is None:
+            from .note_generator import GeneratedNote
+            self._note_type = GeneratedNote
+        self.model_name = generator.model_name
+        self.prompt_version = getattr(generator, 'prompt_version', '')
+        self._cache_model = self.model_name
+        if getattr(generator, 'enable_model_routing', False):
+            # Some chunks are generated by a different model; keep them apart
+            self._cache_model = f"{self.model_name}+{generator.routing_model}"
+
+    def _key(self, chunk, settings=None) -> str:
+        return NoteCache.make_key(chunk, self._cache_model, self.prompt_version, **(settings or {}))
+
+    def _lookup(self, chunk, key: str):
+        note = self.cache.get(key, self._note_type)
+        if note is None:
+            return None
+
+        # The same text may appear at a different position; re-point the note
+        return dataclasses.replace(
+            note,
+            source_chunk_ids=[chunk.chunk_id],
+            source_pages=list(chunk.source_pages),
+            chapter_title=chunk.chapter_title
+        )
+
+    def _store(self, key: str, note) -> None:
+        if not getattr(note, 'is_fallback', False):
+            self.cache.set(key, note)
+
+    def generate_note_from_chunk(self, chunk, **settings):
+        key = self._key(chunk, settings)
+        note = self._lookup(chunk, key)
+        if note is None:
+            note = self.generator.generate_note_from_chunk(chunk, **settings)
+            self._store(key, note)
+        return note
+
+    async def generate_note_async(self, chunk, on_delta=None, **settings):
+        key = self._key(chunk, settings)
+        # The lookup can wait on the lock behind another task's commit; keep
+        # it off the event loop, like the store
+        note = await asyncio.to_thread(self._lookup, chunk, key)
+        if note is None:
+            # on_delta only reports progress, so it isn't part of the key
+            if on_delta is not None:
+                settings['on_delta'] = on_delta
+            note = await self.generator.generate_note_async(chunk, **settings)
+            await asyncio.to_thread(self._store, key, note)
+        return note
+
+    def is_packable(self, chunk) -> bool:
+        is_packable = getattr(self.generator, 'is_packable', None)
+        return is_packable is not None and is_packable(chunk)
+
+    @property
+    def pack_max_chars(self) -> int:
+        return getattr(self.generator, 'pack_max_chars', 0)
+
+    async def generate_group_async(self, chunks: List, **settings) -> List:
+        keys = [self._key(chunk, settings) for chunk in chunks]
+        notes: List[Optional[object]] = [
+            await asyncio.to_thread(self._lookup, chunk, key) for chunk, key in zip(chunks, keys)
+        ]
+
+        # Only the misses are packed into a request
+        missing = [i for i, note in enumerate(notes) if note is None]
+        if len(missing) == 1:
+            i = missing[0]
+            notes[i] = await self.generator.generate_note_async(chunks[i], **settings)
+        elif missing:
+            generated = await self.generator.generate_group_async(
+                [chunks[i] for i in missing],
+                **settings
+            )
+            for i, note in zip(missing, generated):
+                notes[i] = note
+        for i in missing:
+            await asyncio.to_thread(self._store, keys[i], notes[i])
+
+        return notes
+
+    async def aclose(self):
+        aclose = getattr(self.generator, 'aclose', None)
+        if aclose is not None:
+            await aclose()
+
+    def generate_notes_batch(self, chunks: List, **kwargs) -> List:
+        # Only pass on what the wrapped generator takes: NoteGenerator wants
+        # batch_size, APIBasedNoteGenerator temperature/max_tokens/concurrency
+        params = inspect.signature(self.generator.generate_notes_batch).parameters
+        if not any(p.kind is p.VAR_KEYWORD for p in params.values()):
+            kwargs = {name: value for name, value in kwargs.items() if name in params}
+
+        # Keyed like the single-chunk path, on the settings that shape the note
+        settings = {name: value for name, value in kwargs.items() if name not in _SCHEDULING_ARGS}
+        keys = [self._key(chunk, settings) for chunk in chunks]
+        notes: List[Optional[object]] = [
+            self._lookup(chunk, key) for chunk, key in zip(chunks, keys)
+        ]
+
+        # Only the misses go to the model, still as one batch
+        missing = [i for i, note in enumerate(notes) if note is None]
+        if missing:
+            generated = self.generator.generate_notes_batch(
+                [chunks[i] for i in missing],
+                **kwargs
+            )
+            for i, note in zip(missing, generated):
+                notes[i] = note
+                self._store(keys[i], note)
+
+        return notes
@@ -6,15 +6,55 @@ Trying -c 1024 -o 128
 python main.py ./ebooks/<book>.pdf -c 1024 -o 128
 """
 
-from transformers import AutoTokenizer, AutoModelForCausalLM, pipeline
-import torch
-from typing import List, Dict
-from dataclasses import dataclass
+import asyncio
+import httpx
+from typing import Dict, Iterator, List
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from dataclasses import asdict, dataclass
 from .text_chunker import TextChunk
 import requests
-import json
+import orjson
+import hashlib
+import re
+from functools import lru_cache
 from pathlib import Path
 from enum import Enum
+from tqdm import tqdm
+
+# Words marking a sentence worth keeping in a fallback note
+_KEYWORDS = frozenset({
+    'important', 'key', 'main', 'concept', 'algorithm', 'method', 'approach', 'technique',
+})
+_KEYWORD_RE = re.compile("|".join(sorted(_KEYWORDS)), re.IGNORECASE)
+
+# Sampling options sent with every Ollama request
+_OLLAMA_OPTIONS = {
+    "temperature": 0.4, # 0.6, # lower temp for more focus
+    # "num_predict": 800
+    "num_ctx": 8192,
+    "top_p": 0.85, # 0.9, # slightly lower for more consistent structure
+    "repeat_penalty": 1.1, # help to reduce repetitive formatting
+}
+
+_JSON_HEADERS = {"Content-Type": "application/json"}
+
+# The fixed instructions come first, so every request starts with the same
+# tokens and Ollama can reuse their KV cache; only the tail is prefilled
+_PROMPT_WITH_CHAPTER = "{base_prompt}\n\nChapter: {chapter_title}\n\n{text}\n\nNotes:"
+_PROMPT_NO_CHAPTER = "{base_prompt}\n\n{text}\n\nNotes:"
+
+# A note line worth keeping, captured without surrounding whitespace: over 10
+# characters once stripped and not an echo of the prompt's labels
+_CLEAN_LINE_RE = re.compile(r'^[^\S\n]*(?!Chapter:|Text:|Notes:)(\S[^\n]{9,}\S)[^\S\n]*$', re.MULTILINE)
+
+
+@lru_cache(maxsize=None)
+def _load_prompt(name: str) -> str:
+    """Read a prompt file once per process; every generator shares the text."""
+    with open(Path(__file__).resolve().parent / "prompts" / "latest" / name, 'r') as file:
+        return file.read()
 
 class Model(Enum):
     Qwen3_8b = "qwen3:8b"
@@ -29,6 +69,7 @@ class GeneratedNote:
     source_chunk_ids: List[int]
     source_pages: List[int]
     chapter_title: str = ""
+    is_fallback: bool = False  # True when generation failed and a heuristic note was used
 
 class NoteGenerator:
     def __init__(self, model_name: str = "mistral", device = None):
@@ -40,81 +81,163 @@ class NoteGenerator:
         # self.model_name = str(Model.Qwen3_14b) # "qwen3:8b" # must have pulled | uses 94% GPU-Util
         self.model_name = "qwen3:14b" # "qwen3:8b" # must have pulled | uses 94% GPU-Util
         self.ollama_url = "http://localhost:11434/api/generate"
-        with open(Path(__file__).resolve().parent / "prompts" / "latest" / "system_prompt.txt", 'r') as file:
-            self.system_prompt = file.read()
-        with open(Path(__file__).resolve().parent / "prompts" / "latest" / "base_prompt.txt", 'r') as file:
-            self.base_prompt = file.read()
+        self.system_prompt = _load_prompt("system_prompt.txt")
+        self.base_prompt = _load_prompt("base_prompt.txt")
+        # Cached notes are invalidated whenever the prompt files, layout or
+        # sampling options change
+        digest = hashlib.blake2b(digest_size=8)
+        for part in (self.system_prompt, self.base_prompt, _PROMPT_WITH_CHAPTER, _PROMPT_NO_CHAPTER):
+            digest.update(part.encode('utf-8'))
+            digest.update(b'\0')
+        digest.update(orjson.dumps(_OLLAMA_OPTIONS, option=orjson.OPT_SORT_KEYS))
+        self.prompt_version = digest.hexdigest()
+        # Keep-alive connections to Ollama, shared by generate_notes_batch's threads
+        self._session = requests.Session()
+        self._session.mount("http://", requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=8))
+        # Created on first use in each event loop (see _get_async_client)
+        self.aclient = None
+        self._aclient_loop = None
     
     def generate_note_from_chunk(self, chunk: TextChunk) -> GeneratedNote:
-        prompt = self._create_note_prompt(chunk.content, chunk.chapter_title)
-        
         try:
-            response = requests.post(
-                self.ollama_url,
-                json={
-                    "model": self.model_name,
-                    "prompt": prompt,
-                    "stream": False,
-                    "system": self.system_prompt,
-                    "options": {
-                        "temperature": 0.4, # 0.6, # lower temp for more focus
-                        # "num_predict": 800
-                        "num_ctx": 8192,
-                        "top_p": 0.85, # 0.9, # slightly lower for more consistent structure
-                        "repeat_penalty": 1.1, # help to reduce repetitive formatting
-                    }
-                }
-            )
-            
-            result = response.json()
-            note_content = result['response'].strip()
-            note_content = self._clean_generated_note(note_content)
-            
-            return GeneratedNote(
-                content=note_content,
-                source_chunk_ids=[chunk.chunk_id],
-                source_pages=chunk.source_pages,
-                chapter_title=chunk.chapter_title
-            )
-            
+            parts = []
+            with self._session.post(self.ollama_url, data=self._request_body(chunk),
+                                    headers=_JSON_HEADERS, stream=True) as response:
+                for line in response.iter_lines():
+                    if line and self._add_stream_part(line, parts):
+                        break
+            return self._note_from_text(chunk, "".join(parts))
         except Exception as e:
-            print(f"Error generating note for chunk {chunk.chunk_id}: {e}")
-            return GeneratedNote(
-                content=self._create_fallback_note(chunk.content),
-                source_chunk_ids=[chunk.chunk_id],
-                source_pages=chunk.source_pages,
-                chapter_title=chunk.chapter_title
-            )
+            return self._fallback_for_chunk(chunk, e)
+
+    async def generate_note_async(self, chunk: TextChunk) -> GeneratedNote:
+        # Ollama decodes concurrent requests together (OLLAMA_NUM_PARALLEL),
+        # so callers can keep several of these in flight on one event loop
+        try:
+            parts = []
+            async with self._get_async_client().stream(
+                "POST", self.ollama_url, content=self._request_body(chunk), headers=_JSON_HEADERS
+            ) as response:
+                async for line in response.aiter_lines():
+                    if line and self._add_stream_part(line, parts):
+                        break
+            return self._note_from_text(chunk, "".join(parts))
+        except Exception as e:
+            return self._fallback_for_chunk(chunk, e)
+
+    def _get_async_client(self) -> httpx.AsyncClient:
+        # httpx connection pools can't be reused once their event loop closes,
+        # so each asyncio.run() gets its own client
+        loop = asyncio.get_running_loop()
+        if self.aclient is None or self._aclient_loop is not loop:
+            # Local generation can take minutes, so don't time out (like requests)
+            self.aclient = httpx.AsyncClient(timeout=None)
+            self._aclient_loop = loop
+        return self.aclient
+
+    async def aclose(self):
+        if self.aclient is not None:
+            await self.aclient.aclose()
+            self.aclient = None
+            self._aclient_loop = None
+
+    def _request_body(self, chunk: TextChunk) -> bytes:
+        # orjson serializes the (often many-KB) prompt several times faster than json
+        return orjson.dumps({
+            "model": self.model_name,
+            "prompt": self._create_note_prompt(chunk.content, chunk.chapter_title),
+            # Tokens arrive as they're decoded instead of in one response at the end
+            "stream": True,
+            "system": self.system_prompt,
+            "options": _OLLAMA_OPTIONS
+        })
+
+    @staticmethod
+    def _add_stream_part(line, parts: List[str]) -> bool:
+        # Each line is a JSON object holding the next piece of text; the last has done=true
+        piece = orjson.loads(line)
+        if 'error' in piece:
+            raise RuntimeError(piece['error'])
+        parts.append(piece['response'])
+        return piece.get('done', False)
+
+    def _note_from_text(self, chunk: TextChunk, text: str) -> GeneratedNote:
+        note_content = text.strip()
+        note_content = self._clean_generated_note(note_content)
+
+        return GeneratedNote(
+            content=note_content,
+            source_chunk_ids=[chunk.chunk_id],
+            source_pages=chunk.source_pages,
+            chapter_title=chunk.chapter_title
+        )
+
+    def _fallback_for_chunk(self, chunk: TextChunk, error: Exception) -> GeneratedNote:
+        # Requests run under the CLI's progress bar; print above it
+        tqdm.write(f"Error generating note for chunk {chunk.chunk_id}: {error}")
+        return GeneratedNote(
+            content=self._create_fallback_note(chunk.content),
+            source_chunk_ids=[chunk.chunk_id],
+            source_pages=chunk.source_pages,
+            chapter_title=chunk.chapter_title,
+            is_fallback=True
+        )
     
+    def generate_notes_batch(self, chunks: List[TextChunk], batch_size: int = 1) -> List[GeneratedNote]:
+        return list(self.iter_notes(chunks, batch_size))
+
+    def iter_notes(self, chunks: List[TextChunk], batch_size: int = 1) -> Iterator[GeneratedNote]:
+        # Ollama decodes concurrent requests together (OLLAMA_NUM_PARALLEL),
+        # so keep up to batch_size requests in flight to fill the GPU.
+        # Notes are yielded in chunk order as they're ready; a new chunk is
+        # only submitted once an earlier note is taken, so a slow consumer
+        # never has more than batch_size notes pending.
+        if batch_size <= 1 or len(chunks) <= 1:
+            for chunk in chunks:
+                yield self.generate_note_from_chunk(chunk)
+            return
+
+        remaining = iter(chunks)
+        with ThreadPoolExecutor(max_workers=min(batch_size, len(chunks))) as executor:
+            pending = deque(
+                executor.submit(self.generate_note_from_chunk, chunk)
+                for chunk in islice(remaining, batch_size)
+            )
+            while pending:
+                note = pending.popleft().result()
+                chunk = next(remaining, None)
+                if chunk is not None:
+                    pending.append(executor.submit(self.generate_note_from_chunk, chunk))
+                yield note
+
+    def stream_notes_to_file(self, chunks: List[TextChunk], path: str, batch_size: int = 1) -> int:
+        # Writes each note as a JSON line as soon as it's generated, so a long
+        # book never holds every note in memory and a crash keeps what's done.
+        # Returns the number of notes written.
+        count = 0
+        with open(path, 'wb') as file:
+            for note in self.iter_notes(chunks, batch_size):
+                file.write(orjson.dumps(asdict(note)) + b"\n")
+                file.flush()
+                count += 1
+        return count
+
     def _create_note_prompt(self, text: str, chapter_title: str = "") -> str:
         
         if chapter_title:
-            return f"Chapter: {chapter_title}\n\n{self.base_prompt}\n\n{text}\n\nNotes:"
-        return f"{self.base_prompt}\n\n{text}\n\nNotes:"
+            return _PROMPT_WITH_CHAPTER.format(base_prompt=self.base_prompt, chapter_title=chapter_title, text=text)
+        return _PROMPT_NO_CHAPTER.format(base_prompt=self.base_prompt, text=text)
 
     def _clean_generated_note(self, note: str) -> str:
-        lines = note.split('\n')
-        cleaned_lines = []
-
-        for line in lines:
-            line = line.strip()
-            if (line and
-                not line.startswith("Chapter:") and
-                not line.startswith("Text:") and
-                not line.startswith("Notes:") and
-                len(line) > 10):
-                cleaned_lines.append(line)
-
-        return '\n'.join(cleaned_lines)
+        return '\n'.join(_CLEAN_LINE_RE.findall(note))
 
     def _create_fallback_note(self, text: str) -> str:
-        sentences = text.split('. ')
+        # Only the first five sentences are looked at, so don't split the rest
+        sentences = text.split('. ', 5)
         key_sentences = []
 
         for sentence in sentences[:5]:
-            if (len(sentence) > 20 and
-                any(keyword in sentence.lower() for keyword in
-                    ['important', 'key', 'main', 'concept', 'algorithm', 'method', 'approach', 'technique'])):
+            if len(sentence) > 20 and _KEYWORD_RE.search(sentence):
                 key_sentences.append(sentence.strip())
 
         if not key_sentences and sentences:
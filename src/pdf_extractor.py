@@ -1,6 +1,10 @@
+import multiprocessing
+import os
 import pymupdf
 import re
-from typing import List, Tuple
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+from typing import Iterator, List, Tuple
 from dataclasses import dataclass
 
 
@@ -12,12 +16,18 @@ class ExtractedText:
 
 
 class PDFExtractor:
+    # Ranges with fewer pages than this are extracted in-process; starting
+    # worker processes would cost more than it saves
+    parallel_min_pages = 64
+
     def __init__(self, pdf_path: str):
         self.pdf_path = pdf_path
         self.doc = pymupdf.open(pdf_path)
 
     def extract_text(self) -> List[ExtractedText]:
-        extracted_sections = []
+        return list(self.iter_sections())
+
+    def iter_sections(self) -> Iterator[ExtractedText]:
         current_chapter = ""
 
         for page_num in range(len(self.doc)):
@@ -33,16 +43,12 @@ class PDFExtractor:
 
             cleaned_text = self._clean_text(text)
             if len(cleaned_text.strip()) > 100:
-                extracted_sections.append(
-                    ExtractedText(
-                        content=cleaned_text,
-                        page_number=page_num + 1,
-                        chapter_title=current_chapter
-                    )
+                yield ExtractedText(
+                    content=cleaned_text,
+                    page_number=page_num + 1,
+                    chapter_title=current_chapter
                 )
 
-        return extracted_sections
-
     def _detect_chapter_title(self, text: str) -> str:
         lines = text.split('\n')
         for line in lines[:5]:
@@ -73,6 +79,34 @@ class PDFExtractor:
 
         return ' '.join(text_content)
 
+    def get_text_by_pages_parallel(self, start_page: int = 0, end_page: int = None,
+                                   max_workers: int = None) -> str:
+        if end_page is None:
+            end_page = len(self.doc)
+        end_page = min(end_page, len(self.doc))
+        page_count = end_page - start_page
+
+        if max_workers is None:
+            max_workers = os.cpu_count() or 1
+        max_workers = min(max_workers, page_count)
+
+        if max_workers <= 1 or page_count < self.parallel_min_pages:
+            return self.get_text_by_pages(start_page, end_page)
+
+        # Split the range into one contiguous slice per worker; each worker
+        # opens its own document since PyMuPDF handles can't be shared
+        step = -(-page_count // max_workers)
+        starts = range(start_page, end_page, step)
+        ends = [min(start + step, end_page) for start in starts]
+
+        # Spawn rather than fork: the CLI calls this from a producer thread while
+        # the event loop and its worker threads run, and forking a multi-threaded
+        # process can deadlock on locks those threads hold
+        with ProcessPoolExecutor(max_workers=max_workers,
+                                 mp_context=multiprocessing.get_context("spawn")) as executor:
+            parts = executor.map(_extract_page_range, repeat(self.pdf_path), starts, ends)
+            return ' '.join(part for part in parts if part)
+
     def close(self):
         if self.doc:
             self.doc.close()
@@ -83,3 +117,7 @@ class PDFExtractor:
     def __exit__(self, exc_type, exc_val, exc_tb):
         self.close()
 
+
+def _extract_page_range(pdf_path: str, start_page: int, end_page: int) -> str:
+    with PDFExtractor(pdf_path) as extractor:
+        return extractor.get_text_by_pages(start_page, end_page)
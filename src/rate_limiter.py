@@ -0,0 +1,87 @@
+"""
+Client-side rate limiting for API requests.
+
+Requests are metered before they're sent, so a concurrent batch stays under the
+account's tokens-per-minute and requests-per-minute limits instead of running
+into 429 responses and backing off.
+"""
+
+import asyncio
+import time
+from typing import Optional
+
+
+class RateLimiter:
+    """
+    Token bucket limiting both tokens and requests per minute.
+
+    Both buckets start full and refill continuously at tpm/60 and rpm/60 per
+    second. acquire() waits until the request fits in both buckets.
+    """
+
+    def __init__(self, tpm: int = 400_000, rpm: int = 50):
+        """
+        Args:
+            tpm: Tokens allowed per minute (input estimate + max output)
+            rpm: Requests allowed per minute
+        """
+        self.tpm = tpm
+        self.rpm = rpm
+        self.available_tokens = float(tpm)
+        self.available_requests = float(rpm)
+        self._last_refill = time.monotonic()
+
+        # asyncio.Lock is tied to the event loop it first waits on, so a new
+        # one is made for each loop (e.g. each asyncio.run() call)
+        self._lock: Optional[asyncio.Lock] = None
+        self._lock_loop = None
+
+    def _get_lock(self) -> asyncio.Lock:
+        loop = asyncio.get_running_loop()
+        if self._lock is None or self._lock_loop is not loop:
+            self._lock = asyncio.Lock()
+            self._lock_loop = loop
+        return self._lock
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        elapsed = now - self._last_refill
+        self._last_refill = now
+
+        self.available_tokens = min(self.tpm, self.available_tokens + elapsed * self.tpm / 60)
+        self.available_requests = min(self.rpm, self.available_requests + elapsed * self.rpm / 60)
+
+    async def acquire(self, tokens: int) -> None:
+        """
+        Wait until a request of the given size can be sent, then reserve it.
+
+        Args:
+            tokens: Estimated tokens the request will use
+        """
+        # A request bigger than the whole bucket would otherwise wait forever
+        tokens = min(tokens, self.tpm)
+
+        async with self._get_lock():
+            while True:
+                self._refill()
+                if self.available_tokens >= tokens and self.available_requests >= 1:
+                    self.available_tokens -= tokens
+                    self.available_requests -= 1
+                    return
+
+                wait = max(
+                    (tokens - self.available_tokens) * 60 / self.tpm,
+                    (1 - self.available_requests) * 60 / self.rpm,
+                )
+                await asyncio.sleep(wait)
+
+    def drain(self) -> None:
+        """
+        Empty both buckets.
+
+        Called when the server reports a rate limit anyway, so queued requests
+        wait for the buckets to refill instead of piling on.
+        """
+        self._refill()
+        self.available_tokens = 0.0
+        self.available_requests = 0.0
@@ -3,9 +3,15 @@ Sliding window text chunker with hierarchical summarization.
 Creates overlapping chunks to ensure no content is missed, then intelligently merges notes.
 """
 
-import tiktoken
+import re
+from bisect import bisect_left, bisect_right
 from typing import List, Tuple
 from dataclasses import dataclass
+from .text_chunker import get_encoding
+
+
+# Whitespace following terminal punctuation marks the start of a new sentence
+SENTENCE_SPLIT_RE = re.compile(r'(?<=[.!?])\s+')
 
 
 @dataclass
@@ -19,6 +25,7 @@ class WindowedChunk:
     start_token_idx: int = 0  # Position in original text
     end_token_idx: int = 0    # Position in original text
     overlap_with_prev: bool = False  # Is this chunk overlapping with previous?
+    context_prefix_len: int = 0  # Leading characters of content repeated from the previous chunk
 
 
 class SlidingWindowChunker:
@@ -44,7 +51,7 @@ class SlidingWindowChunker:
         self.chunk_size = chunk_size
         self.overlap_ratio = overlap_ratio
         self.overlap_size = int(chunk_size * overlap_ratio)
-        self.encoding = tiktoken.get_encoding("cl100k_base")
+        self.encoding = get_encoding("cl100k_base")
 
     def count_tokens(self, text: str) -> int:
         """Count tokens in text."""
@@ -86,6 +93,7 @@ class SlidingWindowChunker:
         stride = self.chunk_size - self.overlap_size  # How far to move each window
 
         start_idx = 0
+        prev_end_idx = 0
         while start_idx < total_tokens:
             end_idx = min(start_idx + self.chunk_size, total_tokens)
             chunk_tokens = tokens[start_idx:end_idx]
@@ -94,18 +102,23 @@ class SlidingWindowChunker:
             if chunk_text.strip():
                 # Mark if this chunk overlaps with previous
                 overlap_with_prev = (chunk_id > 0)
+                content = chunk_text.strip()
 
                 chunks.append(WindowedChunk(
-                    content=chunk_text.strip(),
+                    content=content,
                     chunk_id=chunk_id,
                     source_pages=source_pages.copy(),
                     chapter_title=chapter_title,
                     token_count=len(chunk_tokens),
                     start_token_idx=start_idx,
                     end_token_idx=end_idx,
-                    overlap_with_prev=overlap_with_prev
+                    overlap_with_prev=overlap_with_prev,
+                    context_prefix_len=self._context_prefix_len(
+                        tokens, start_idx, prev_end_idx, content
+                    ) if overlap_with_prev else 0
                 ))
                 chunk_id += 1
+                prev_end_idx = end_idx
 
             # Move window forward by stride
             start_idx += stride
@@ -122,9 +135,12 @@ class SlidingWindowChunker:
                                    chapter_title: str = "",
                                    target_chunk_size: int = None) -> List[WindowedChunk]:
         """
-        Create chunks respecting sentence/paragraph boundaries with overlap.
+        Create chunks respecting sentence boundaries with overlap.
         Better quality than pure token-based chunking as it doesn't split mid-sentence.
 
+        The text is tokenized once; windows are slices of that token array whose
+        edges are snapped to sentence starts, so no window is ever re-encoded.
+
         Args:
             text: The text to chunk
             source_pages: Which pages this text comes from
@@ -134,77 +150,91 @@ class SlidingWindowChunker:
         Returns:
             List of WindowedChunk objects
         """
-        import re
-
         if target_chunk_size is None:
             target_chunk_size = self.chunk_size
 
-        # Split into sentences
-        sentences = re.split(r'(?<=[.!?])\s+', text)
+        tokens = self.encoding.encode(text)
+        total_tokens = len(tokens)
+        boundaries = self._sentence_boundaries(text, tokens)
 
         chunks = []
-        current_chunk = ""
         chunk_id = 0
-        overlap_buffer = ""  # Keep track of last part for overlap
-        token_idx = 0
+        start_idx = 0
+        prev_end_idx = 0
+
+        while start_idx < total_tokens:
+            end_idx = min(start_idx + target_chunk_size, total_tokens)
+
+            # End the window at the last sentence start that fits. If no such
+            # start lies past the previous window's end (a single sentence
+            # longer than the window), cut at the token limit instead so
+            # every window advances
+            if end_idx < total_tokens:
+                pos = bisect_right(boundaries, end_idx) - 1
+                if pos >= 0 and boundaries[pos] > max(start_idx, prev_end_idx):
+                    end_idx = boundaries[pos]
+
+            chunk_text = self.encoding.decode(tokens[start_idx:end_idx]).strip()
+
+            if chunk_text:
+                overlap_with_prev = chunk_id > 0 and start_idx < prev_end_idx
+                chunks.append(WindowedChunk(
+                    content=chunk_text,
+                    chunk_id=chunk_id,
+                    source_pages=source_pages.copy(),
+                    chapter_title=chapter_title,
+                    token_count=end_idx - start_idx,
+                    start_token_idx=start_idx,
+                    end_token_idx=end_idx,
+                    overlap_with_prev=overlap_with_prev,
+                    context_prefix_len=self._context_prefix_len(
+                        tokens, start_idx, prev_end_idx, chunk_text
+                    ) if overlap_with_prev else 0
+                ))
+                chunk_id += 1
+                prev_end_idx = end_idx
 
-        for i, sentence in enumerate(sentences):
-            test_chunk = current_chunk + " " + sentence if current_chunk else sentence
-            test_token_count = self.count_tokens(test_chunk)
+            if end_idx >= total_tokens:
+                break
 
-            if test_token_count <= target_chunk_size:
-                current_chunk = test_chunk
+            # Start the next window with the whole sentences from the last
+            # ~overlap_ratio of this one
+            overlap_start = end_idx - int((end_idx - start_idx) * self.overlap_ratio)
+            pos = bisect_left(boundaries, overlap_start)
+            if pos < len(boundaries) and boundaries[pos] < end_idx and boundaries[pos] > start_idx:
+                start_idx = boundaries[pos]
             else:
-                # Current chunk is full, save it
-                if current_chunk:
-                    chunk_text = current_chunk.strip()
-                    token_count = self.count_tokens(chunk_text)
-
-                    chunks.append(WindowedChunk(
-                        content=chunk_text,
-                        chunk_id=chunk_id,
-                        source_pages=source_pages.copy(),
-                        chapter_title=chapter_title,
-                        token_count=token_count,
-                        start_token_idx=token_idx,
-                        end_token_idx=token_idx + token_count,
-                        overlap_with_prev=(chunk_id > 0)
-                    ))
-
-                    # Keep the last ~30% of this chunk as overlap for next chunk
-                    overlap_size_tokens = int(token_count * self.overlap_ratio)
-                    if overlap_size_tokens > 0:
-                        # Get last sentences that fit in overlap
-                        overlap_sentences = []
-                        overlap_tokens = 0
-                        for sent in reversed(chunk_text.split('. ')):
-                            sent_tokens = self.count_tokens(sent)
-                            if overlap_tokens + sent_tokens <= overlap_size_tokens:
-                                overlap_sentences.insert(0, sent)
-                                overlap_tokens += sent_tokens
-                            else:
-                                break
-                        overlap_buffer = '. '.join(overlap_sentences) + ". "
-
-                    token_idx += token_count
-                    chunk_id += 1
-
-                # Start new chunk with overlap
-                current_chunk = overlap_buffer + sentence if overlap_buffer else sentence
-
-        # Don't forget the last chunk
-        if current_chunk:
-            chunk_text = current_chunk.strip()
-            token_count = self.count_tokens(chunk_text)
-            chunks.append(WindowedChunk(
-                content=chunk_text,
-                chunk_id=chunk_id,
-                source_pages=source_pages.copy(),
-                chapter_title=chapter_title,
-                token_count=token_count,
-                start_token_idx=token_idx,
-                end_token_idx=token_idx + token_count,
-                overlap_with_prev=(chunk_id > 0)
-            ))
+                start_idx = end_idx
 
         return chunks
+
+    def _context_prefix_len(self, tokens: List[int], start_idx: int,
+                            prev_end_idx: int, content: str) -> int:
+        """
+        Count the leading characters of content already seen in the previous chunk.
+
+        Note generators use this to treat the overlap as context only, rather
+        than taking notes on the same text twice.
+        """
+        prefix = self.encoding.decode(tokens[start_idx:prev_end_idx]).lstrip()
+        if prefix and content.startswith(prefix):
+            return len(prefix)
+        return 0
+
+    def _sentence_boundaries(self, text: str, tokens: List[int]) -> List[int]:
+        """
+        Map sentence starts in text to token indices.
+
+        Returns:
+            Sorted token indices at which a new sentence begins
+        """
+        _, offsets = self.encoding.decode_with_offsets(tokens)
+
+        boundaries = []
+        for match in SENTENCE_SPLIT_RE.finditer(text):
+            # Index of the token containing the first character of the sentence
+            idx = bisect_right(offsets, match.end()) - 1
+            if idx > 0 and (not boundaries or idx > boundaries[-1]):
+                boundaries.append(idx)
+
+        return boundaries
@@ -1,6 +1,15 @@
 import tiktoken
 from typing import List, Tuple
 from dataclasses import dataclass
+from functools import lru_cache
+
+
+@lru_cache(maxsize=None)
+def get_encoding(model_or_encoding: str = "cl100k_base") -> tiktoken.Encoding:
+    # Loading BPE ranks is slow, so every chunker shares one encoder per name
+    if model_or_encoding in tiktoken.list_encoding_names():
+        return tiktoken.get_encoding(model_or_encoding)
+    return tiktoken.encoding_for_model(model_or_encoding)
 
 
 @dataclass
@@ -16,20 +25,25 @@ class TextChunker:
     def __init__(self, max_chunk_size: int = 2048, overlap_size: int = 200):
         self.max_chunk_size = max_chunk_size
         self.overlap_size = overlap_size
-        self.encoding = tiktoken.get_encoding("cl100k_base")
+        self.encoding = get_encoding("cl100k_base")
 
     def count_tokens(self, text: str) -> int:
         return len(self.encoding.encode(text))
 
+    def count_tokens_batch(self, texts: List[str]) -> List[int]:
+        # tiktoken encodes a batch on its own thread pool
+        return [len(tokens) for tokens in self.encoding.encode_batch(texts)]
+
     def chunk_by_tokens(self, text: str, source_pages: List[int], chapter_title: str = "") -> List[TextChunk]:
         chunks = []
         tokens = self.encoding.encode(text)
         total_tokens = len(tokens)
 
+        # If text is smaller than chunk size, return it as is; decoding the
+        # tokens would only rebuild the same string
         if total_tokens <= self.max_chunk_size:
-            decoded_text = self.encoding.decode(tokens)
             return [TextChunk(
-                content=decoded_text,
+                content=text,
                 chunk_id=0,
                 source_pages=source_pages,
                 chapter_title=chapter_title,
@@ -64,90 +78,65 @@ class TextChunker:
     def chunk_by_sentences(self, text: str, source_pages: List[int], chapter_title: str = "") -> List[TextChunk]:
         import re
         sentences = re.split(r'(?<=[.!?])\s+', text)
-        chunks = []
-        current_chunk = ""
-        chunk_id = 0
-
-        for sentence in sentences:
-            test_chunk = current_chunk + " " + sentence if current_chunk else sentence
-
-            if self.count_tokens(test_chunk) <= self.max_chunk_size:
-                current_chunk = test_chunk
-            else:
-                if current_chunk:
-                    chunks.append(TextChunk(
-                        content=current_chunk.strip(),
-                        chunk_id=chunk_id,
-                        source_pages=source_pages.copy(),
-                        chapter_title=chapter_title,
-                        token_count=self.count_tokens(current_chunk)
-                    ))
-                    chunk_id += 1
-
-                if self.count_tokens(sentence) <= self.max_chunk_size:
-                    current_chunk = sentence
-                else:
-                    sentence_chunks = self.chunk_by_tokens(sentence, source_pages, chapter_title)
-                    for sc in sentence_chunks:
-                        sc.chunk_id = chunk_id
-                        chunks.append(sc)
-                        chunk_id += 1
-                    current_chunk = ""
-
-        if current_chunk:
-            chunks.append(TextChunk(
-                content=current_chunk.strip(),
-                chunk_id=chunk_id,
-                source_pages=source_pages.copy(),
-                chapter_title=chapter_title,
-                token_count=self.count_tokens(current_chunk)
-            ))
-
-        return chunks
+        return self._pack_pieces(sentences, " ", source_pages, chapter_title, self.chunk_by_tokens)
 
     def smart_chunk(self, text: str, source_pages: List[int], chapter_title: str = "") -> List[TextChunk]:
-        paragraphs = text.split('\n\n')
+        paragraphs = [p.strip() for p in text.split('\n\n')]
+        return self._pack_pieces(paragraphs, "\n\n", source_pages, chapter_title, self.chunk_by_sentences)
+
+    def _pack_pieces(self, pieces: List[str], separator: str, source_pages: List[int],
+                     chapter_title: str, split_oversized) -> List[TextChunk]:
+        # Greedily packs pieces into chunks, tracking a running token count so
+        # each piece is tokenized once instead of re-encoding the growing chunk.
+        # Adding the separator's tokens slightly overestimates the joined size,
+        # so chunks never exceed max_chunk_size.
+        separator_tokens = self.count_tokens(separator)
         chunks = []
-        current_chunk = ""
+        current_parts = []
+        current_tokens = 0
         chunk_id = 0
 
-        for paragraph in paragraphs:
-            paragraph = paragraph.strip()
-            if not paragraph:
+        for piece in pieces:
+            if not piece:
                 continue
 
-            test_chunk = current_chunk + "\n\n" + paragraph if current_chunk else paragraph
+            piece_tokens = self.count_tokens(piece)
+            test_tokens = current_tokens + separator_tokens + piece_tokens if current_parts else piece_tokens
 
-            if self.count_tokens(test_chunk) <= self.max_chunk_size:
-                current_chunk = test_chunk
+            if test_tokens <= self.max_chunk_size:
+                current_parts.append(piece)
+                current_tokens = test_tokens
             else:
-                if current_chunk:
+                if current_parts:
+                    content = separator.join(current_parts).strip()
                     chunks.append(TextChunk(
-                        content=current_chunk.strip(),
+                        content=content,
                         chunk_id=chunk_id,
                         source_pages=source_pages.copy(),
                         chapter_title=chapter_title,
-                        token_count=self.count_tokens(current_chunk)
+                        token_count=self.count_tokens(content)
                     ))
                     chunk_id += 1
 
-                if self.count_tokens(paragraph) <= self.max_chunk_size:
-                    current_chunk = paragraph
+                if piece_tokens <= self.max_chunk_size:
+                    current_parts = [piece]
+                    current_tokens = piece_tokens
                 else:
-                    para_chunks = self.chunk_by_sentences(paragraph, source_pages, chapter_title)
-                    for pc in para_chunks:
-                        pc.chunk_id = chunk_id
-                        chunks.append(pc)
+                    for sub_chunk in split_oversized(piece, source_pages, chapter_title):
+                        sub_chunk.chunk_id = chunk_id
+                        chunks.append(sub_chunk)
                         chunk_id += 1
-                    current_chunk = ""
+                    current_parts = []
+                    current_tokens = 0
 
-        if current_chunk:
+        if current_parts:
+            content = separator.join(current_parts).strip()
             chunks.append(TextChunk(
-                content=current_chunk.strip(),
+                content=content,
                 chunk_id=chunk_id,
                 source_pages=source_pages.copy(),
                 chapter_title=chapter_title,
-                token_count=self.count_tokens(current_chunk)
+                token_count=self.count_tokens(content)
             ))
 
-        return chunks
\ No newline at end of file
+        return chunks